@@ -0,0 +1,94 @@
+"""
+Hash-uirea / verificarea parolelor (bcrypt) în afara event loop-ului.
+
+bcrypt durează zeci de ms per apel și eliberează GIL-ul, așa că rulează pe un pool dedicat de
+thread-uri (PASSWORD_HASH_WORKERS). În fața pool-ului stă un limitator: cel mult
+PASSWORD_HASH_WORKERS operații rulează simultan, restul așteaptă la coadă; peste
+PASSWORD_HASH_MAX_WAITING cereri în așteptare răspundem imediat cu 503, în loc să lăsăm
+latența să crească nelimitat.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+PASSWORD_HASH_MAX_WAITING = int(os.getenv("PASSWORD_HASH_MAX_WAITING", "200"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_waiting: int = PASSWORD_HASH_MAX_WAITING):
+        self.workers = workers
+        self.max_waiting = max_waiting
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._semaphore = None  # creat în event loop-ul serviciului, la primul apel
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_waiting_seen = 0
+        self.completed = 0
+        self.rejected = 0
+        self._wait_ms_total = 0.0
+        self._hash_ms_total = 0.0
+
+    async def _run(self, fn, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+
+        if self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication service is busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        self.max_waiting_seen = max(self.max_waiting_seen, self.waiting)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        started = time.perf_counter()
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+            self.completed += 1
+            self._wait_ms_total += (started - queued_at) * 1000
+            self._hash_ms_total += (time.perf_counter() - started) * 1000
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(pwd_context.verify, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        done = self.completed
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting_seen,
+            "queue_limit": self.max_waiting,
+            "completed": done,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self._wait_ms_total / done, 3) if done else 0.0,
+            "avg_hash_ms": round(self._hash_ms_total / done, 3) if done else 0.0,
+        }
+
+
+password_hasher = PasswordHasher()
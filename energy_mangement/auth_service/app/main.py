@@ -1,20 +1,22 @@
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware  # CORS
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import jwt
 from datetime import datetime, timedelta
 import os
-import requests  # Pentru sincronizare
+import time
 
 from . import models, schemas, database
+from .hashing import password_hasher
+from .outbox import user_sync_worker
 
 # Configurare
 SECRET_KEY = os.getenv("SECRET_KEY", "un-secret-foarte-sigur-default")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
-USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://user_service:8000/users/")
 
 app = FastAPI(root_path="/auth")
 
@@ -30,17 +32,7 @@ app.add_middleware(
 # 2. Setup DB
 models.Base.metadata.create_all(bind=database.engine)
 
-# 3. Security Tools
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
+# 3. Security Tools (bcrypt rulează pe pool-ul din hashing.py, nu în event loop)
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
@@ -56,53 +48,56 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
 # --- RUTE ---
 
 @app.post("/register", status_code=status.HTTP_201_CREATED)
-def register(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(database.get_async_db)):
     """
     Înregistrează un utilizator nou în Auth DB și îl sincronizează cu User DB.
     """
     # 1. Verifică dacă există în Auth DB
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
-    if db_user:
+    result = await db.execute(select(models.User).where(models.User.username == user.username))
+    if result.scalars().first():
         raise HTTPException(status_code=400, detail="Username already registered")
 
     # 2. Hash parola și salvează în Auth DB
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await password_hasher.hash(user.password)
     new_user = models.User(
         username=user.username,
         hashed_password=hashed_password,
         role=user.role
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-
-    # 3. SINCRONIZARE: Trimite datele și la User Service
-    # Astfel, Admin-ul îl va vedea în listă, iar user-ul va avea profil.
     try:
-        requests.post(
-            USER_SERVICE_URL,
-            json={
-                "username": user.username,
-                "password": user.password,  # Trimitem parola raw ca user_service sa o hash-uiasca si el
-                "role": user.role,
-                "auth_id": new_user.id
-            },
-            timeout=5
-        )
-    except Exception as e:
-        print(f"Sync error with User Service: {e}")
-        # Nu oprim înregistrarea dacă sync-ul eșuează, dar e bine de știut.
+        await db.flush()  # avem nevoie de new_user.id pentru outbox
+
+        # 3. SINCRONIZARE: rândul din outbox intră în aceeași tranzacție cu utilizatorul.
+        # Worker-ul din outbox.py îl trimite la User Service (cu reîncercări), deci
+        # /register nu mai așteaptă după User Service și nu mai pierde utilizatori dacă e căzut.
+        now_ms = int(time.time() * 1000)
+        db.add(models.UserSyncOutbox(
+            auth_id=new_user.id,
+            username=new_user.username,
+            hashed_password=hashed_password,  # User Service nu mai re-hash-uiește parola
+            role=new_user.role,
+            created_at=now_ms,
+            next_attempt_at=now_ms,
+        ))
+        await db.commit()
+    except IntegrityError:
+        # Două înregistrări simultane cu același username: indexul unic o respinge pe a doua
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Username already registered")
 
+    user_sync_worker.notify()
     return {"message": "User created successfully"}
 
 
 @app.post("/login", response_model=schemas.Token)
 async def login_for_access_token(
         form_data: OAuth2PasswordRequestForm = Depends(),
-        db: Session = Depends(database.get_db)
+        db: AsyncSession = Depends(database.get_async_db)
 ):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    result = await db.execute(select(models.User).where(models.User.username == form_data.username))
+    user = result.scalars().first()
+    if not user or not await password_hasher.verify(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -116,4 +111,20 @@ async def login_for_access_token(
         expires_delta=access_token_expires
     )
 
-    return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
+    return {"access_token": access_token, "token_type": "bearer"}
+
+
+@app.on_event("startup")
+def startup_event():
+    user_sync_worker.start()
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    password_hasher.shutdown()
+
+
+@app.get("/metrics")
+def get_metrics():
+    """ Starea pool-ului de hash-uire (coadă, respingeri, latențe) și a sincronizării cu User Service """
+    return {"password_hashing": password_hasher.stats(), "user_sync": user_sync_worker.stats()}
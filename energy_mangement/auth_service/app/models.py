@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import BigInteger, Column, Integer, String
 from .database import Base
 
 class User(Base):
@@ -6,4 +6,22 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
-    role = Column(String, default="Client", nullable=False)
\ No newline at end of file
+    role = Column(String, default="Client", nullable=False)
+
+
+class UserSyncOutbox(Base):
+    """
+    Utilizatorii care trebuie creați și în user_service. Rândul e scris în aceeași tranzacție
+    cu utilizatorul din auth, apoi trimis (în loturi, cu reîncercări) de worker-ul din outbox.py.
+    """
+    __tablename__ = "user_sync_outbox"
+    id = Column(Integer, primary_key=True)
+    auth_id = Column(Integer, unique=True, nullable=False)
+    username = Column(String, nullable=False)
+    hashed_password = Column(String, nullable=False)  # user_service primește hash-ul, nu îl recalculează
+    role = Column(String, nullable=False)
+    created_at = Column(BigInteger, nullable=False)  # ms
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(BigInteger, nullable=False, index=True)  # ms
+    sent_at = Column(BigInteger, nullable=True, index=True)  # NULL = încă de trimis
+    last_error = Column(String, nullable=True)
@@ -0,0 +1,142 @@
+"""
+Outbox pentru sincronizarea auth_service -> user_service.
+
+/register doar scrie utilizatorul și rândul din user_sync_outbox în aceeași tranzacție;
+worker-ul de aici trimite rândurile în așteptare, în loturi, la POST /users/bulk și le marchează
+trimise. La eroare (user_service jos, timeout) rândurile rămân în tabel și se reîncearcă
+cu backoff exponențial, deci niciun utilizator nu se mai pierde pe drum.
+"""
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import select
+
+from . import database, models
+
+USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://user_service:8000/users/")
+USER_SERVICE_BULK_URL = os.getenv("USER_SERVICE_BULK_URL", USER_SERVICE_URL.rstrip("/") + "/bulk")
+# Trebuie să fie același token ca în user_service (fără el, user_service refuză /bulk)
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_INTERVAL_SECONDS = float(os.getenv("OUTBOX_POLL_INTERVAL_SECONDS", "1"))
+OUTBOX_MAX_BACKOFF_SECONDS = int(os.getenv("OUTBOX_MAX_BACKOFF_SECONDS", "300"))
+OUTBOX_HTTP_TIMEOUT_SECONDS = float(os.getenv("OUTBOX_HTTP_TIMEOUT_SECONDS", "10"))
+
+
+class UserSyncWorker:
+    def __init__(self):
+        # O singură sesiune HTTP: conexiunile keep-alive către user_service sunt refolosite
+        self.http = requests.Session()
+        self.http.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        if INTERNAL_API_TOKEN:
+            self.http.headers["X-Internal-Token"] = INTERNAL_API_TOKEN
+        else:
+            print(" [!] [OUTBOX] INTERNAL_API_TOKEN not set, user_service will reject the sync", flush=True)
+
+        self._wakeup = threading.Event()
+        self._thread = None
+
+        self.sent = 0
+        self.conflicts = 0
+        self.failed_attempts = 0
+        self.pending = 0
+        self.last_error = None
+
+    def notify(self):
+        """ Apelat după un /register: trimitem imediat, fără să așteptăm intervalul de polling """
+        self._wakeup.set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="user-sync-outbox", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        print(f" [*] [OUTBOX] Sending user sync batches to {USER_SERVICE_BULK_URL}", flush=True)
+        while True:
+            try:
+                # Golim tot ce e de trimis, lot după lot
+                while self.drain_once() >= OUTBOX_BATCH_SIZE:
+                    pass
+            except Exception as e:
+                print(f" [!] [OUTBOX] Drain failed: {e}", flush=True)
+            self._wakeup.wait(OUTBOX_POLL_INTERVAL_SECONDS)
+            self._wakeup.clear()
+
+    def drain_once(self) -> int:
+        """ Trimite un lot; returnează câte rânduri au fost preluate """
+        now_ms = int(time.time() * 1000)
+        db = database.SessionLocal()
+        try:
+            # SKIP LOCKED: mai multe replici auth_service nu trimit același rând de două ori
+            rows = db.execute(
+                select(models.UserSyncOutbox)
+                .where(models.UserSyncOutbox.sent_at.is_(None), models.UserSyncOutbox.next_attempt_at <= now_ms)
+                .order_by(models.UserSyncOutbox.id)
+                .limit(OUTBOX_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            ).scalars().all()
+            self.pending = len(rows)
+            if not rows:
+                db.rollback()
+                return 0
+
+            payload = {"users": [
+                {"auth_id": r.auth_id, "username": r.username, "hashed_password": r.hashed_password, "role": r.role}
+                for r in rows
+            ]}
+            try:
+                response = self.http.post(USER_SERVICE_BULK_URL, json=payload, timeout=OUTBOX_HTTP_TIMEOUT_SECONDS)
+                response.raise_for_status()
+                results = {item["auth_id"]: item["status"] for item in response.json()["results"]}
+            except Exception as e:
+                self._schedule_retry(rows, now_ms, str(e))
+                db.commit()
+                return 0
+
+            for row in rows:
+                status = results.get(row.auth_id)
+                if status is None:
+                    self._schedule_retry([row], now_ms, "missing from bulk response")
+                    continue
+                row.sent_at = now_ms
+                if status == "conflict":
+                    # Username-ul există deja în user_service cu alt auth_id: reîncercarea nu ajută
+                    row.last_error = "username already exists in user_service"
+                    self.conflicts += 1
+                    print(f" [!] [OUTBOX] User '{row.username}' conflicts with an existing user_service user",
+                          flush=True)
+                else:
+                    row.last_error = None
+                    self.sent += 1
+            db.commit()
+            print(f" [OUTBOX] Synced {len(rows)} users in {(time.time() * 1000 - now_ms):.0f} ms", flush=True)
+            return len(rows)
+        finally:
+            db.close()
+
+    def _schedule_retry(self, rows, now_ms: int, error: str):
+        self.failed_attempts += 1
+        self.last_error = error
+        for row in rows:
+            row.attempts += 1
+            backoff = min(2 ** row.attempts, OUTBOX_MAX_BACKOFF_SECONDS)
+            row.next_attempt_at = now_ms + backoff * 1000
+            row.last_error = error[:500]
+        print(f" [!] [OUTBOX] Sync of {len(rows)} users failed: {error}. Will retry.", flush=True)
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "conflicts": self.conflicts,
+            "failed_attempts": self.failed_attempts,
+            "last_batch_size": self.pending,
+            "last_error": self.last_error,
+        }
+
+
+user_sync_worker = UserSyncWorker()
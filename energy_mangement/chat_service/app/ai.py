@@ -0,0 +1,169 @@
+"""
+Apelurile către modelul AI, în afara event loop-ului.
+
+generate_content e blocant (secunde per răspuns), așa că rulează pe un pool dedicat de thread-uri
+(AI_WORKERS). Cel mult AI_WORKERS apeluri rulează simultan, restul așteaptă la coadă; peste
+AI_MAX_WAITING cereri în așteptare răspundem imediat că AI-ul e ocupat. Fiecare apel are un
+timeout (AI_TIMEOUT_SECONDS); la depășire clientul primește mesajul de indisponibilitate.
+
+Pentru teste de încărcare fără cheie Gemini: AI_FAKE_MODEL=1 (răspunde după AI_FAKE_LATENCY_SECONDS).
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import google.generativeai as genai
+
+AI_WORKERS = int(os.getenv("AI_WORKERS", "8"))
+AI_MAX_WAITING = int(os.getenv("AI_MAX_WAITING", "500"))
+AI_TIMEOUT_SECONDS = float(os.getenv("AI_TIMEOUT_SECONDS", "20"))
+AI_FAKE_MODEL = os.getenv("AI_FAKE_MODEL", "0") == "1"
+AI_FAKE_LATENCY_SECONDS = float(os.getenv("AI_FAKE_LATENCY_SECONDS", "1.0"))
+
+
+class AIBusyError(Exception):
+    """ Coada de așteptare e plină """
+
+
+class FakeModel:
+    """ Model local care doar doarme: simulează latența unui apel real către API """
+
+    class Response:
+        def __init__(self, text: str):
+            self.text = text
+
+    def __init__(self, latency: float = AI_FAKE_LATENCY_SECONDS):
+        self.latency = latency
+
+    def generate_content(self, prompt: str):
+        time.sleep(self.latency)
+        return FakeModel.Response("Răspuns de test (model local).")
+
+
+def load_model():
+    """ Modelul Gemini (cu detectare automată) sau FakeModel; None dacă AI-ul nu e configurat """
+    if AI_FAKE_MODEL:
+        print(f" [AI DEBUG] Folosim modelul local de test ({AI_FAKE_LATENCY_SECONDS}s per răspuns)", flush=True)
+        return FakeModel()
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        print(" [WARNING] GEMINI_API_KEY not found!", flush=True)
+        return None
+
+    try:
+        genai.configure(api_key=api_key)
+
+        print(" [AI DEBUG] Caut un model valid...", flush=True)
+        available_models = []
+        # Listăm modelele disponibile pentru contul tău
+        for m in genai.list_models():
+            if 'generateContent' in m.supported_generation_methods:
+                available_models.append(m.name)
+
+        # Algoritm de selecție: Preferăm Flash -> Pro -> Primul găsit
+        selected_model = None
+        preferences = ["models/gemini-1.5-flash", "models/gemini-pro", "models/gemini-1.0-pro"]
+
+        for pref in preferences:
+            if pref in available_models:
+                selected_model = pref
+                break
+
+        if not selected_model and available_models:
+            selected_model = available_models[0]  # Fallback la orice avem
+
+        if selected_model:
+            # Important: API-ul uneori vrea "models/gemini-pro", alteori doar "gemini-pro"
+            # Curățăm prefixul pentru instanțiere dacă e nevoie, dar de obicei merge cu numele full din listă
+            print(f" [AI DEBUG] Am selectat modelul: {selected_model}", flush=True)
+            return genai.GenerativeModel(selected_model)
+        print(" [AI ERROR] Nu am găsit niciun model compatibil!", flush=True)
+
+    except Exception as e:
+        print(f" [AI ERROR] Configurare eșuată: {e}", flush=True)
+    return None
+
+
+class AIResponder:
+    def __init__(self, model, workers: int = AI_WORKERS, max_waiting: int = AI_MAX_WAITING,
+                 timeout: float = AI_TIMEOUT_SECONDS):
+        self.model = model
+        self.workers = workers
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ai")
+        self._semaphore = None  # creat în event loop-ul serviciului, la primul apel
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_waiting_seen = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self._wait_ms_total = 0.0
+        self._generate_ms_total = 0.0
+
+    async def generate(self, prompt: str) -> str:
+        """ Textul răspunsului. Aruncă AIBusyError, asyncio.TimeoutError sau eroarea modelului. """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+
+        if self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise AIBusyError()
+
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        self.max_waiting_seen = max(self.max_waiting_seen, self.waiting)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        started = time.perf_counter()
+        self._wait_ms_total += (started - queued_at) * 1000
+        self.in_flight += 1
+        future = asyncio.get_running_loop().run_in_executor(self._executor, self.model.generate_content, prompt)
+        # Locul din pool se eliberează abia când thread-ul termină efectiv (și după un timeout)
+        future.add_done_callback(lambda _: self._release(started))
+        try:
+            response = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        self.completed += 1
+        return response.text
+
+    def _release(self, started: float):
+        self.in_flight -= 1
+        self._generate_ms_total += (time.perf_counter() - started) * 1000
+        self._semaphore.release()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        done = self.completed + self.failed + self.timeouts
+        return {
+            "model": type(self.model).__name__ if self.model else None,
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting_seen,
+            "queue_limit": self.max_waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self._wait_ms_total / done, 3) if done else 0.0,
+            "avg_generate_ms": round(self._generate_ms_total / done, 3) if done else 0.0,
+        }
+
+
+ai_responder = AIResponder(load_model())
@@ -0,0 +1,57 @@
+"""
+Răspunsurile fixe (FAQ) ale chat-ului, încărcate din configurare (CHAT_INTENTS_FILE, implicit intents.json).
+
+Fiecare intenție are o listă de cuvinte cheie și un răspuns; ordinea din fișier e prioritatea.
+Toate cuvintele cheie sunt compilate într-un singur regex (câte un grup per intenție), deci un
+mesaj e verificat cu o singură trecere, oricâte intenții ar fi configurate.
+"""
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+CHAT_INTENTS_FILE = os.getenv("CHAT_INTENTS_FILE", os.path.join(os.path.dirname(__file__), "intents.json"))
+
+
+class IntentRouter:
+    def __init__(self, intents: List[dict]):
+        self.names = [intent["name"] for intent in intents]
+        self.responses = [intent["response"] for intent in intents]
+        groups = []
+        for index, intent in enumerate(intents):
+            # Cele mai lungi întâi, ca alternanța să nu se oprească pe un prefix
+            keywords = sorted((k.lower() for k in intent["keywords"]), key=len, reverse=True)
+            groups.append(f"(?P<i{index}>" + "|".join(re.escape(k) for k in keywords) + ")")
+        self.pattern = re.compile("|".join(groups)) if groups else None
+        self.matches: Dict[str, int] = {name: 0 for name in self.names}
+        self.misses = 0
+
+    @classmethod
+    def from_file(cls, path: str = CHAT_INTENTS_FILE) -> "IntentRouter":
+        with open(path, encoding="utf-8") as f:
+            intents = json.load(f)
+        print(f" [CHAT] Loaded {len(intents)} intents from {path}", flush=True)
+        return cls(intents)
+
+    def match(self, text: str) -> Optional[Tuple[str, str]]:
+        """ (intenție, răspuns) pentru textul deja transformat în litere mici, sau None """
+        best = None
+        if self.pattern is not None:
+            # Un mesaj poate atinge mai multe intenții: câștigă cea cu prioritatea cea mai mare
+            for found in self.pattern.finditer(text):
+                index = int(found.lastgroup[1:])
+                if best is None or index < best:
+                    best = index
+                    if best == 0:
+                        break
+        if best is None:
+            self.misses += 1
+            return None
+        self.matches[self.names[best]] += 1
+        return self.names[best], self.responses[best]
+
+    def stats(self) -> dict:
+        return {"matches": dict(self.matches), "misses": self.misses}
+
+
+intent_router = IntentRouter.from_file()
@@ -1,10 +1,14 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import pika
+import asyncio
 import json
 import os
-import google.generativeai as genai
+import time
+from shared.rabbit_publisher import RabbitPublisher
+from .ai import AIBusyError, ai_responder
+from .intents import intent_router
+from .response_cache import response_cache
 
 app = FastAPI()
 
@@ -20,47 +24,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# --- CONFIGURARE AI (CU DETECTARE AUTOMATĂ) ---
-api_key = os.getenv("GEMINI_API_KEY")
-model = None
-
-if api_key:
-    try:
-        genai.configure(api_key=api_key)
-
-        print(" [AI DEBUG] Caut un model valid...", flush=True)
-        available_models = []
-        # Listăm modelele disponibile pentru contul tău
-        for m in genai.list_models():
-            if 'generateContent' in m.supported_generation_methods:
-                available_models.append(m.name)
-
-        # Algoritm de selecție: Preferăm Flash -> Pro -> Primul găsit
-        selected_model = None
-        preferences = ["models/gemini-1.5-flash", "models/gemini-pro", "models/gemini-1.0-pro"]
-
-        for pref in preferences:
-            if pref in available_models:
-                selected_model = pref
-                break
-
-        if not selected_model and available_models:
-            selected_model = available_models[0]  # Fallback la orice avem
-
-        if selected_model:
-            # Important: API-ul uneori vrea "models/gemini-pro", alteori doar "gemini-pro"
-            # Curățăm prefixul pentru instanțiere dacă e nevoie, dar de obicei merge cu numele full din listă
-            print(f" [AI DEBUG] Am selectat modelul: {selected_model}", flush=True)
-            model = genai.GenerativeModel(selected_model)
-        else:
-            print(" [AI ERROR] Nu am găsit niciun model compatibil!", flush=True)
-
-    except Exception as e:
-        print(f" [AI ERROR] Configurare eșuată: {e}", flush=True)
-else:
-    print(" [WARNING] GEMINI_API_KEY not found!", flush=True)
-
-
 class Message(BaseModel):
     sender_id: int
     message: str
@@ -68,27 +31,69 @@ class Message(BaseModel):
 
 
 # --- RABBITMQ HELPER ---
+# O singură conexiune, deschisă o dată; mesajele pleacă din thread-ul publisher-ului
+publisher = RabbitPublisher(host=os.getenv("RABBIT_HOST", "rabbitmq"), name="chat-publisher")
+# Exchange direct pentru notificări (routing key: user.<id>), consumat de websocket_service
+EXCHANGE_NOTIFICATIONS = "notifications"
+publisher.declare_exchange(EXCHANGE_NOTIFICATIONS, "direct")
+
+
 def send_to_websocket(target_user_id, message_text, sender_role="System"):
+    payload = {
+        "user_id": target_user_id,
+        "message": f"[{sender_role}]: {message_text}",
+        "type": "chat"
+    }
+
+    # Nu blochează: doar pune mesajul în buffer
+    publisher.publish(routing_key=f"user.{target_user_id}", body=json.dumps(payload), exchange=EXCHANGE_NOTIFICATIONS)
+
+
+@app.on_event("startup")
+def startup_event():
+    publisher.start()
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    ai_responder.shutdown()
+    publisher.close()
+
+
+@app.get("/chat/metrics")
+def get_metrics():
+    """ Publisher-ul, pool-ul AI (coadă, timeouts, latențe), cache-ul de răspunsuri și intențiile """
+    return {
+        "publisher": publisher.stats(),
+        "ai": ai_responder.stats(),
+        "response_cache": response_cache.stats(),
+        "intents": intent_router.stats(),
+    }
+
+
+# Răspunsurile AI în curs (referințele țin task-urile în viață până la final)
+ai_tasks = set()
+
+
+async def reply_with_ai(sender_id: int, question: str):
+    """ Rulează în fundal: cererea HTTP a primit deja răspunsul, replica pleacă prin websocket """
+    prompt = f"Ești un asistent expert în energie; răspunde scurt și politicos în română, nu inventa date personale și direcționează problemele tehnice către un operator. Întrebarea este: {question}"
+    role = "AI Assistant"
+    started = time.perf_counter()
     try:
-        rabbitmq_host = os.getenv("RABBIT_HOST", "rabbitmq")
-        connection = pika.BlockingConnection(pika.ConnectionParameters(host=rabbitmq_host))
-        channel = connection.channel()
-        channel.queue_declare(queue='notification_queue', durable=True)
-
-        payload = {
-            "user_id": target_user_id,
-            "message": f"[{sender_role}]: {message_text}",
-            "type": "chat"
-        }
-
-        channel.basic_publish(
-            exchange='',
-            routing_key='notification_queue',
-            body=json.dumps(payload)
-        )
-        connection.close()
+        response = await ai_responder.generate(prompt)
+        # Doar răspunsurile reușite intră în cache; latența e cea văzută de client (coadă + generare)
+        response_cache.put(question, response, (time.perf_counter() - started) * 1000)
+    except AIBusyError:
+        response, role = "AI ocupat momentan, încearcă din nou în câteva secunde.", "Support Bot"
+    except asyncio.TimeoutError:
+        print(f" [AI GENERATE ERROR] Timeout for {sender_id}", flush=True)
+        response, role = "AI indisponibil momentan.", "Support Bot"
     except Exception as e:
-        print(f" [ERROR] RabbitMQ: {e}", flush=True)
+        # Aici prindem eroarea exactă dacă tot nu merge
+        print(f" [AI GENERATE ERROR] {e}", flush=True)
+        response, role = "AI indisponibil momentan.", "Support Bot"
+    send_to_websocket(sender_id, response, sender_role=role)
 
 
 # --- RUTA PRINCIPALĂ ---
@@ -112,33 +117,27 @@ async def send_message(msg: Message):
         send_to_websocket(msg.sender_id, "Un operator a fost notificat.", sender_role="System")
         return {"status": "Notified Admin"}
 
-    # B. Reguli + AI
+    # B. Reguli (intents.json) + AI
     response = ""
     role = "Support Bot"
 
-    if "program" in text:
-        response = "Luni-Vineri: 09:00 - 17:00."
-    elif "contact" in text:
-        response = "Email: contact@energy.com"
-    elif "pret" in text:
-        response = "Pretul este de 0.80 RON pe kW."
-    elif "ajutor" in text:
-        response = "Daca ai nevoie sa contactezi un operator foloseste "+ "/admin" + " in fata mesajului tau."
+    intent = intent_router.match(text)
+    if intent is not None:
+        response = intent[1]
+    elif ai_responder.model:
+        # Aceeași întrebare (normalizată) a primit deja răspuns recent: nu mai chemăm modelul
+        cached = response_cache.get(msg.message)
+        if cached is not None:
+            send_to_websocket(msg.sender_id, cached, sender_role="AI Assistant")
+            return {"status": "Processed"}
+
+        # AI Logic: nu așteptăm modelul în request, răspunsul ajunge prin websocket
+        task = asyncio.get_running_loop().create_task(reply_with_ai(msg.sender_id, msg.message))
+        ai_tasks.add(task)
+        task.add_done_callback(ai_tasks.discard)
+        return {"status": "Queued"}
     else:
-        # AI Logic
-        if model:
-            try:
-
-                prompt = f"Ești un asistent expert în energie; răspunde scurt și politicos în română, nu inventa date personale și direcționează problemele tehnice către un operator. Întrebarea este: {msg.message}"
-                ai_response = model.generate_content(prompt)
-                response = ai_response.text
-                role = "AI Assistant"
-            except Exception as e:
-                # Aici prindem eroarea exactă dacă tot nu merge
-                print(f" [AI GENERATE ERROR] {e}", flush=True)
-                response = "AI indisponibil momentan."
-        else:
-            response = "AI neconfigurat."
+        response = "AI neconfigurat."
 
     send_to_websocket(msg.sender_id, response, sender_role=role)
-    return {"status": "Processed"}
\ No newline at end of file
+    return {"status": "Processed"}
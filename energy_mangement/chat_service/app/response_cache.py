@@ -0,0 +1,79 @@
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "1000"))
+CHAT_CACHE_TTL_SECONDS = float(os.getenv("CHAT_CACHE_TTL_SECONDS", "600"))
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize_question(text: str) -> str:
+    """ "Cât e prețul?!" și "cat e pretul" dau aceeași cheie: fără diacritice, punctuație și spații duble """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_WORD.sub(" ", text).strip()
+
+
+class ResponseCache:
+    """
+    Cache LRU cu TTL pentru răspunsurile AI, cu cheia = întrebarea normalizată.
+    Ținem și cât a durat generarea fiecărui răspuns, ca să raportăm latența economisită la hit-uri.
+    Folosit doar din event loop-ul serviciului, deci fără lock.
+    """
+
+    def __init__(self, max_size: int = CHAT_CACHE_SIZE, ttl_seconds: float = CHAT_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str, float]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.saved_ms = 0.0
+
+    def get(self, question: str) -> Optional[str]:
+        key = normalize_question(question)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, answer, generate_ms = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved_ms += generate_ms
+                return answer
+            del self._entries[key]
+            self.expired += 1
+        self.misses += 1
+        return None
+
+    def put(self, question: str, answer: str, generate_ms: float):
+        if self.max_size <= 0:
+            return
+        key = normalize_question(question)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, answer, generate_ms)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "saved_ms": round(self.saved_ms, 1),
+        }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,173 @@
+"""
+Trimiterea către socket-uri fără ca un client lent să-i blocheze pe ceilalți.
+
+Fiecare conexiune are propria coadă de ieșire (limitată la WS_SEND_QUEUE_SIZE mesaje) și propriul
+task writer care o golește. Cine livrează un mesaj doar îl pune în coadă (O(1), fără await),
+deci trimiterile către conexiuni diferite rulează în paralel. Când un client rămâne în urmă și
+coada i se umple, aplicăm WS_SLOW_CLIENT_POLICY:
+  - "drop_oldest": aruncăm cel mai vechi mesaj din coadă (clientul vede ultimele actualizări)
+  - "disconnect":  închidem conexiunea (clientul se reconectează și reîncarcă starea)
+Un send care durează peste WS_SEND_TIMEOUT_SECONDS (socket pe jumătate mort) închide conexiunea.
+
+Benchmark (10k socket-uri, 1% lente), trimitere secvențială vs cozi per conexiune:
+
+    python -m app.connections --sockets 10000 --slow-percent 1
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Callable, Optional, Set
+
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+WS_SLOW_CLIENT_POLICY = os.getenv("WS_SLOW_CLIENT_POLICY", "drop_oldest")  # sau "disconnect"
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))
+# Heartbeat-ul aplicației: clientul răspunde la fiecare heartbeat cu {"type": "pong"}; conexiunile
+# de la care n-am primit nimic (mesaj sau pong) de WS_IDLE_TIMEOUT_SECONDS sunt închise de reaper.
+# Trimiterile reușite nu contează: un client mort poate accepta date în buffer-ul TCP.
+WS_HEARTBEAT_INTERVAL_SECONDS = float(os.getenv("WS_HEARTBEAT_INTERVAL_SECONDS", "30"))
+WS_IDLE_TIMEOUT_SECONDS = float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", "90"))
+
+# Frontend-ul ignoră mesajele cu alt `type` decât cel pe care îl așteaptă
+HEARTBEAT_MESSAGE = json.dumps({"type": "heartbeat"})
+
+
+class ClientConnection:
+    def __init__(self, websocket, user_id: Optional[int] = None,
+                 on_close: Optional[Callable[["ClientConnection"], None]] = None,
+                 queue_size: int = WS_SEND_QUEUE_SIZE, policy: str = WS_SLOW_CLIENT_POLICY,
+                 send_timeout: float = WS_SEND_TIMEOUT_SECONDS):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.devices: Set[int] = set()  # device-urile la care e abonat (fluxul live de consum)
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=queue_size)
+        self.last_client_activity = time.monotonic()  # ultimul frame primit de la client
+        self.dropped = 0
+        self.closed = False
+        self.close_reason: Optional[str] = None
+        self._on_close = on_close
+        self._writer = asyncio.get_running_loop().create_task(self._write_loop())
+
+    def send(self, message: str) -> bool:
+        """ Pune mesajul în coada conexiunii; nu așteaptă după socket """
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if self.policy == "disconnect":
+            self.close("send queue full")
+            return False
+        self.queue.get_nowait()
+        self.dropped += 1
+        self.queue.put_nowait(message)
+        return True
+
+    def touch(self):
+        """ Apelat la fiecare mesaj primit de la client (inclusiv pong-ul la heartbeat) """
+        self.last_client_activity = time.monotonic()
+
+    async def _write_loop(self):
+        try:
+            while True:
+                message = await self.queue.get()
+                await asyncio.wait_for(self.websocket.send_text(message), self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self.close(f"send blocked for more than {self.send_timeout}s")
+        except Exception as e:
+            self.close(f"send failed: {e}")
+
+    def close(self, reason: Optional[str] = None):
+        """ Idempotent: oprește writer-ul, închide socket-ul și anunță manager-ul """
+        if self.closed:
+            return
+        self.closed = True
+        self.close_reason = reason
+        if reason:
+            print(f" [WS] Closing connection (user {self.user_id}): {reason}", flush=True)
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        asyncio.get_running_loop().create_task(self._close_socket())
+        if self._on_close is not None:
+            self._on_close(self)
+
+    async def _close_socket(self):
+        try:
+            await asyncio.wait_for(self.websocket.close(), self.send_timeout)
+        except Exception:
+            pass  # socket-ul e deja închis / mort
+
+
+# ==================================================================================
+# BENCHMARK
+# ==================================================================================
+
+class _FakeSocket:
+    def __init__(self, delay: float, received: list):
+        self.delay = delay
+        self.received = received
+
+    async def send_text(self, message: str):
+        await asyncio.sleep(self.delay)
+        self.received.append(time.perf_counter() - float(message))
+
+    async def close(self):
+        pass
+
+
+def _report(name: str, latencies: list, elapsed: float):
+    latencies = sorted(latencies)
+    pick = lambda p: latencies[min(int(len(latencies) * p / 100.0), len(latencies) - 1)] * 1000
+    print(f" [BENCH] {name:<22} fast sockets delivered={len(latencies)} "
+          f"p50={pick(50):.1f}ms p99={pick(99):.1f}ms max={latencies[-1] * 1000:.1f}ms "
+          f"(total {elapsed:.2f}s)", flush=True)
+
+
+async def _benchmark(sockets: int, slow_percent: float, slow_delay: float):
+    slow_every = int(100 / slow_percent) if slow_percent > 0 else 0
+    is_slow = lambda i: slow_every and i % slow_every == 0
+
+    # 1. Vechiul mod: await send_text pe fiecare socket, unul după altul
+    received: list = []
+    fakes = [_FakeSocket(slow_delay if is_slow(i) else 0, [] if is_slow(i) else received) for i in range(sockets)]
+    started = time.perf_counter()
+    message = str(started)
+    for ws in fakes:
+        await ws.send_text(message)
+    _report("sequential send_text", received, time.perf_counter() - started)
+
+    # 2. Cozi per conexiune + writer task
+    received = []
+    clients = [
+        ClientConnection(_FakeSocket(slow_delay if is_slow(i) else 0, [] if is_slow(i) else received),
+                         send_timeout=slow_delay * 10)
+        for i in range(sockets)
+    ]
+    fast = sockets - sum(1 for i in range(sockets) if is_slow(i))
+    started = time.perf_counter()
+    message = str(started)
+    for client in clients:
+        client.send(message)
+    while len(received) < fast:
+        await asyncio.sleep(0.001)
+    _report("per-connection queues", received, time.perf_counter() - started)
+    for client in clients:
+        client.close()
+    await asyncio.sleep(0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delivery latency to many sockets with a few slow ones")
+    parser.add_argument("--sockets", type=int, default=10000)
+    parser.add_argument("--slow-percent", type=float, default=1.0)
+    parser.add_argument("--slow-delay", type=float, default=0.2, help="secunde per send pe un socket lent")
+    args = parser.parse_args()
+    asyncio.run(_benchmark(args.sockets, args.slow_percent, args.slow_delay))
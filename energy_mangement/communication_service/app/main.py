@@ -1,120 +1,397 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-import uvicorn
-import pika
+import aio_pika
 import json
 import os
-import threading
 import asyncio
-from typing import Dict, List
+import time
+from typing import Callable, Dict, Iterable, List, Set
+
+from .connections import (ClientConnection, HEARTBEAT_MESSAGE, WS_HEARTBEAT_INTERVAL_SECONDS,
+                          WS_IDLE_TIMEOUT_SECONDS)
 
 app = FastAPI()
 
-# Variabilă globală pentru a stoca bucla principală de evenimente
-main_loop = None
+RABBIT_HOST = os.getenv("RABBIT_HOST", "rabbitmq")
+# Notificările (alerte, chat) vin pe un exchange direct, cu routing key user.<id>.
+# Fiecare replică are propria coadă exclusivă, legată doar de utilizatorii conectați la ea,
+# deci un mesaj ajunge exact la replica (sau replicile) unde userul are socket deschis.
+EXCHANGE_NOTIFICATIONS = "notifications"
+EXCHANGE_CONSUMPTION_UPDATES = "consumption_updates"
+# Câte notificări nealocate (unacked) poate avea replica în zbor
+NOTIFICATION_PREFETCH = int(os.getenv("NOTIFICATION_PREFETCH", "500"))
+
+
+def user_routing_key(user_id: int) -> str:
+    return f"user.{user_id}"
+
+
+def device_routing_key(device_id: int) -> str:
+    return f"device.{device_id}"
+
+
+class QueueBindings:
+    """
+    Binding-urile unei cozi exclusive a replicii: câte unul per cheie de care are nevoie replica
+    (userii conectați pe notificări, device-urile urmărite pe fluxul de consum).
+
+    Apelanții doar anunță cheia; un singur task aduce binding-ul la starea dorită (`wanted`), deci
+    ordinea și duplicatele nu contează. Conexiunea e "robust": la reconectare aio-pika re-declară
+    coada și refacă binding-urile existente.
+    """
+
+    def __init__(self, label: str, routing_key: Callable[[int], str], wanted: Callable[[int], bool]):
+        self.label = label
+        self.routing_key = routing_key
+        self.wanted = wanted
+        self.exchange = None
+        self.queue = None
+        self.bound: Set[int] = set()
+        self._pending: "asyncio.Queue[int]" = None
+        self._task = None
+
+    def attach(self, exchange, queue, keys: Iterable[int]):
+        """ Apelat după prima conectare: legăm și cheile apărute între timp """
+        self.exchange, self.queue = exchange, queue
+        self._pending = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        for key in list(keys):
+            self._pending.put_nowait(key)
+
+    def bind(self, key: int):
+        self._request(key)
+
+    def unbind(self, key: int):
+        self._request(key)
+
+    def _request(self, key: int):
+        if self._pending is not None:
+            self._pending.put_nowait(key)
+
+    async def _run(self):
+        while True:
+            key = await self._pending.get()
+            while True:
+                try:
+                    await self._reconcile(key)
+                    break
+                except Exception as e:
+                    print(f" [ERROR] Binding for {self.label} {key} failed: {e}. Retrying...", flush=True)
+                    await asyncio.sleep(1)
+
+    async def _reconcile(self, key: int):
+        wanted = self.wanted(key)
+        if wanted and key not in self.bound:
+            await self.queue.bind(self.exchange, routing_key=self.routing_key(key))
+            self.bound.add(key)
+        elif not wanted and key in self.bound:
+            await self.queue.unbind(self.exchange, routing_key=self.routing_key(key))
+            self.bound.discard(key)
+
+
+# Notificări: legat cât timp userul are măcar un socket pe replică
+bindings = QueueBindings("User", user_routing_key, lambda user_id: user_id in manager.active_connections)
+# Flux de consum: legat doar pentru device-urile cu cel puțin un viewer pe replică
+stream_bindings = QueueBindings("Device", device_routing_key,
+                                lambda device_id: device_id in manager.device_subscribers)
 
 
 class ConnectionManager:
+    """
+    Evidența socket-urilor deschise pe această replică. Fiecare socket e un ClientConnection
+    (coadă de ieșire + writer propriu), deci livrarea doar pune mesajul în cozi și nu așteaptă
+    niciun client. Toată evidența e pe seturi: conectarea / deconectarea sunt O(1).
+    """
+
     def __init__(self):
-        self.active_connections: Dict[int, List[WebSocket]] = {}
+        self.active_connections: Dict[int, Set[ClientConnection]] = {}
+        # Abonările la fluxurile live de consum: device_id -> conexiunile care îl urmăresc
+        self.device_subscribers: Dict[int, Set[ClientConnection]] = {}
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+
+        self.delivered = 0
+        self.dropped_not_connected = 0
+        self.closed_reasons: Dict[str, int] = {}
 
-    async def connect(self, websocket: WebSocket, user_id: int):
+    async def accept(self, websocket: WebSocket, user_id: int = None) -> ClientConnection:
         await websocket.accept()
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
-        print(f" [WS] User {user_id} connected. Total connections for user: {len(self.active_connections[user_id])}",
-              flush=True)
+        client = ClientConnection(websocket, user_id, on_close=self._forget)
+        self.clients[websocket] = client
+        return client
+
+    async def connect(self, websocket: WebSocket, user_id: int) -> ClientConnection:
+        client = await self.accept(websocket, user_id)
+        connections = self.active_connections.get(user_id)
+        if connections is None:
+            connections = self.active_connections[user_id] = set()
+            # Primul socket al userului pe această replică: îi cerem notificările
+            bindings.bind(user_id)
+        connections.add(client)
+        print(f" [WS] User {user_id} connected. Total connections for user: {len(connections)}", flush=True)
+        return client
+
+    def disconnect(self, websocket: WebSocket):
+        client = self.clients.get(websocket)
+        if client is not None:
+            client.close()
+
+    def _forget(self, client: ClientConnection):
+        """ Apelat o singură dată, când conexiunea se închide (din orice motiv) """
+        self.clients.pop(client.websocket, None)
+        if client.close_reason:
+            reason = client.close_reason.split(":")[0]
+            self.closed_reasons[reason] = self.closed_reasons.get(reason, 0) + 1
+        for device_id in list(client.devices):
+            self.unsubscribe(client, device_id)
 
-    def disconnect(self, websocket: WebSocket, user_id: int):
-        if user_id in self.active_connections:
-            if websocket in self.active_connections[user_id]:
-                self.active_connections[user_id].remove(websocket)
-            if not self.active_connections[user_id]:
-                del self.active_connections[user_id]
-        print(f" [WS] User {user_id} disconnected.", flush=True)
+        if client.user_id is None:
+            return
+        connections = self.active_connections.get(client.user_id)
+        if connections is not None:
+            connections.discard(client)
+            if not connections:
+                del self.active_connections[client.user_id]
+                bindings.unbind(client.user_id)
+        print(f" [WS] User {client.user_id} disconnected.", flush=True)
 
     async def send_personal_message(self, message: str, user_id: int):
+        self.send_many([message], user_id)
+
+    def send_many(self, messages: List[str], user_id: int):
+        """ Toate mesajele pentru un user, puse în cozile conexiunilor lui (fără await) """
         # Aici verificăm dacă userul are conexiuni active
-        if user_id in self.active_connections:
-            print(f" [WS] Sending to User {user_id} (Connections: {len(self.active_connections[user_id])})", flush=True)
-            for connection in self.active_connections[user_id]:
-                try:
-                    await connection.send_text(message)
-                    print(" [WS] Message sent successfully via WebSocket.", flush=True)
-                except Exception as e:
-                    print(f" [ERROR] Could not send via WS: {e}", flush=True)
-        else:
-            print(f" [WS] User {user_id} is NOT connected. Message dropped.", flush=True)
+        connections = self.active_connections.get(user_id)
+        if not connections:
+            self.dropped_not_connected += len(messages)
+            print(f" [WS] User {user_id} is NOT connected. {len(messages)} message(s) dropped.", flush=True)
+            return
+        for client in list(connections):
+            for message in messages:
+                if client.send(message):
+                    self.delivered += 1
+
+    # --- Fluxuri live de consum (per device) ---
+
+    def subscribe(self, client: ClientConnection, device_id: int):
+        if device_id not in self.device_subscribers:
+            self.device_subscribers[device_id] = set()
+            stream_bindings.bind(device_id)
+        self.device_subscribers[device_id].add(client)
+        client.devices.add(device_id)
+        print(f" [WS] Stream subscribe: device {device_id} ({len(self.device_subscribers[device_id])} viewers)",
+              flush=True)
+
+    def unsubscribe(self, client: ClientConnection, device_id: int):
+        client.devices.discard(device_id)
+        viewers = self.device_subscribers.get(device_id)
+        if viewers is not None:
+            viewers.discard(client)
+            if not viewers:
+                del self.device_subscribers[device_id]
+                stream_bindings.unbind(device_id)
+
+    def has_subscribers(self, device_id: int) -> bool:
+        return device_id in self.device_subscribers
+
+    async def broadcast_consumption(self, message: str, device_id: int):
+        """ Pune actualizarea în coada fiecărei conexiuni abonate la acest device """
+        for client in list(self.device_subscribers.get(device_id, ())):
+            client.send(message)
+
+    # --- Heartbeat / reaper ---
+
+    async def run_reaper(self):
+        """ Trimite periodic un heartbeat și închide conexiunile care n-au mai trimis nimic (nici pong) """
+        while True:
+            await asyncio.sleep(WS_HEARTBEAT_INTERVAL_SECONDS)
+            idle_before = time.monotonic() - WS_IDLE_TIMEOUT_SECONDS
+            for client in list(self.clients.values()):
+                if client.last_client_activity < idle_before:
+                    client.close("idle")
+                else:
+                    client.send(HEARTBEAT_MESSAGE)
+
+    def stats(self) -> dict:
+        clients = list(self.clients.values())
+        return {
+            "users": len(self.active_connections),
+            "connections": len(clients),
+            "stream_devices": len(self.device_subscribers),
+            "stream_bindings": len(stream_bindings.bound),
+            "queued_messages": sum(client.queue.qsize() for client in clients),
+            "delivered": self.delivered,
+            "dropped_not_connected": self.dropped_not_connected,
+            "dropped_slow_client": sum(client.dropped for client in clients),
+            "closed": dict(self.closed_reasons),
+        }
 
 
 manager = ConnectionManager()
 
 
 # --- RABBITMQ CONSUMER ---
-def start_rabbitmq_consumer():
-    rabbitmq_host = os.getenv("RABBIT_HOST", "rabbitmq")
-    queue_name = "notification_queue"
 
-    while True:
+class NotificationConsumer:
+    """
+    Consumator aio-pika, direct în event loop-ul uvicorn (fără thread și fără run_coroutine_threadsafe).
+
+    user_id-ul vine din routing key (user.<id>), iar body-ul e trimis mai departe așa cum a venit,
+    fără json.loads / json.dumps. Livrările sosite în aceeași iterație a buclei sunt grupate per
+    user și confirmate cu un singur ack (multiple=True).
+    """
+
+    def __init__(self):
+        self._pending: Dict[int, List[str]] = {}
+        self._last_message = None
+        self._flush_task = None
+
+        self.received = 0
+        self.batches = 0
+        self.invalid = 0
+
+    async def on_message(self, message):
         try:
-            connection = pika.BlockingConnection(
-                pika.ConnectionParameters(host=rabbitmq_host)
-            )
-            channel = connection.channel()
-            channel.queue_declare(queue=queue_name, durable=True)
+            user_id = int(message.routing_key.split(".", 1)[1])
+        except (AttributeError, IndexError, ValueError):
+            self.invalid += 1
+            print(f" [ERROR] Notification with unexpected routing key '{message.routing_key}'", flush=True)
+            await message.ack()
+            return
 
-            print(" [*] RabbitMQ Consumer ready.", flush=True)
+        self.received += 1
+        self._pending.setdefault(user_id, []).append(message.body.decode())
+        self._last_message = message
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush())
 
-            def callback(ch, method, properties, body):
-                try:
-                    data = json.loads(body)
-                    user_id = data.get("user_id")
+    async def _flush(self):
+        await asyncio.sleep(0)  # lăsăm să intre și restul livrărilor deja citite de pe socket
+        pending, last_message = self._pending, self._last_message
+        self._pending, self._last_message, self._flush_task = {}, None, None
 
-                    #Nu extragem doar mesajul, ci trimitem tot obiectul JSON ca string
-                    full_payload = json.dumps(data)
+        for user_id, bodies in pending.items():
+            manager.send_many(bodies, user_id)
+        self.batches += 1
+        try:
+            # Mesajele sunt deja în cozile socket-urilor: confirmăm tot lotul dintr-o dată
+            await last_message.ack(multiple=True)
+        except Exception as e:
+            print(f" [ERROR] Could not ack notification batch: {e}", flush=True)
 
-                    print(f" [RABBIT] Processing alert for User {user_id}", flush=True)
+    def stats(self) -> dict:
+        return {
+            "received": self.received,
+            "batches": self.batches,
+            "avg_batch_size": round(self.received / self.batches, 2) if self.batches else 0.0,
+            "invalid": self.invalid,
+        }
 
-                    if user_id and main_loop:
-                        asyncio.run_coroutine_threadsafe(
-                            # Trimitem JSON-ul complet
-                            manager.send_personal_message(full_payload, int(user_id)),
-                            main_loop
-                        )
-                    else:
-                        print(" [ERROR] Missing data or Main Loop not ready", flush=True)
 
-                except Exception as e:
-                    print(f" [ERROR] Callback error: {e}", flush=True)
+notification_consumer = NotificationConsumer()
 
-            channel.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=True)
-            channel.start_consuming()
 
+async def on_consumption_update(message):
+    """ Actualizările de bucket de la monitoring_service (routing key: device.<id>, fără parsare JSON) """
+    try:
+        device_id = int(message.routing_key.split(".", 1)[1])
+        if manager.has_subscribers(device_id):
+            await manager.broadcast_consumption(message.body.decode(), device_id)
+    except Exception as e:
+        print(f" [ERROR] Stream callback error: {e}", flush=True)
+
+
+async def start_rabbitmq_consumers():
+    """ O conexiune robustă, două canale: notificările (ack manual, prefetch) și fluxul de consum """
+    while True:
+        try:
+            connection = await aio_pika.connect_robust(host=RABBIT_HOST)
+            break
         except Exception as e:
-            print(f" [CRITICAL] RabbitMQ lost. Retrying... {e}", flush=True)
-            import time
-            time.sleep(5)
+            print(f" [CRITICAL] RabbitMQ not reachable. Retrying... {e}", flush=True)
+            await asyncio.sleep(5)
+
+    channel = await connection.channel()
+    await channel.set_qos(prefetch_count=NOTIFICATION_PREFETCH)
+    exchange = await channel.declare_exchange(EXCHANGE_NOTIFICATIONS, aio_pika.ExchangeType.DIRECT, durable=True)
+    # Coadă exclusivă per replică (dispare odată cu conexiunea), legată per user_id
+    queue = await channel.declare_queue(exclusive=True, auto_delete=True)
+    bindings.attach(exchange, queue, manager.active_connections)
+    await queue.consume(notification_consumer.on_message)
+    print(" [*] RabbitMQ Consumer ready.", flush=True)
+
+    stream_channel = await connection.channel()
+    stream_exchange = await stream_channel.declare_exchange(
+        EXCHANGE_CONSUMPTION_UPDATES, aio_pika.ExchangeType.TOPIC, durable=True
+    )
+    # Coadă exclusivă per instanță, legată doar pe device-urile urmărite de clienții ei
+    stream_queue = await stream_channel.declare_queue(exclusive=True, auto_delete=True)
+    stream_bindings.attach(stream_exchange, stream_queue, manager.device_subscribers)
+    await stream_queue.consume(on_consumption_update, no_ack=True)
+    print(" [*] Consumption stream consumer ready.", flush=True)
+    app.state.rabbit_connection = connection
 
 
 @app.on_event("startup")
 async def startup_event():
-    global main_loop
-    # Capturăm bucla principală unde rulează WebSocket-urile
-    main_loop = asyncio.get_running_loop()
+    loop = asyncio.get_running_loop()
+    # Consumatorii rulează în același event loop cu WebSocket-urile (referințele țin task-urile în viață)
+    app.state.rabbit_connection = None
+    app.state.background_tasks = [
+        loop.create_task(start_rabbitmq_consumers()),
+        loop.create_task(manager.run_reaper()),
+    ]
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in app.state.background_tasks:
+        task.cancel()
+    if app.state.rabbit_connection is not None:
+        await app.state.rabbit_connection.close()
 
-    # Pornim consumatorul în fundal
-    consumer_thread = threading.Thread(target=start_rabbitmq_consumer, daemon=True)
-    consumer_thread.start()
+
+@app.get("/ws/metrics")
+def get_metrics():
+    """ Conexiuni, cozi de ieșire și mesaje pierdute pe această replică """
+    return {**manager.stats(), "notifications": notification_consumer.stats()}
 
 
 @app.websocket("/ws/connect/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: int):
-    await manager.connect(websocket, user_id)
+    client = await manager.connect(websocket, user_id)
     try:
         while True:
             # Păstrăm conexiunea vie
             await websocket.receive_text()
+            client.touch()
     except WebSocketDisconnect:
-        manager.disconnect(websocket, user_id)
-    except Exception as e:
-        manager.disconnect(websocket, user_id)
\ No newline at end of file
+        manager.disconnect(websocket)
+    except Exception:
+        manager.disconnect(websocket)
+
+
+@app.websocket("/ws/consumption")
+async def consumption_stream_endpoint(websocket: WebSocket):
+    """
+    Flux live de consum. Clientul trimite:
+        {"action": "subscribe", "device_id": 7} / {"action": "unsubscribe", "device_id": 7}
+    și primește doar actualizările (bucket, total nou, delta) pentru device-urile abonate.
+    """
+    client = await manager.accept(websocket)
+    try:
+        while True:
+            text = await websocket.receive_text()
+            client.touch()
+            try:
+                request = json.loads(text)
+                device_id = int(request["device_id"])
+            except (ValueError, KeyError, TypeError):
+                continue  # ignorăm cererile invalide, păstrăm conexiunea
+
+            if request.get("action") == "subscribe":
+                manager.subscribe(client, device_id)
+            elif request.get("action") == "unsubscribe":
+                manager.unsubscribe(client, device_id)
+    except WebSocketDisconnect:
+        manager.disconnect(websocket)
+    except Exception:
+        manager.disconnect(websocket)
@@ -1,13 +1,37 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from . import models, schemas, database, security
 from fastapi.middleware.cors import CORSMiddleware
-import pika
 import json
+import os
+from shared.listing import LISTING_HEADERS, listing_response, parse_fields
+from shared.rabbit_publisher import RabbitPublisher
 
 models.Base.metadata.create_all(bind=database.engine)
 
+# Ne conectăm la containerul 'rabbitmq' definit în docker-compose
+RABBIT_HOST = os.getenv("RABBIT_HOST", "rabbitmq")
+QUEUE_DEVICE_SYNC = "device_sync_queue"
+# Fanout: coada durabilă (scrierea în DB-ul de monitorizare) + cache-urile fiecărui worker de monitorizare
+EXCHANGE_DEVICE_SYNC = "device_sync"
+# Câte evenimente intră într-un singur mesaj de sync la operațiile în lot
+DEVICE_SYNC_BATCH_SIZE = int(os.getenv("DEVICE_SYNC_BATCH_SIZE", "500"))
+# Numărul maxim de device-uri acceptate într-un request /bulk
+DEVICE_BULK_MAX = int(os.getenv("DEVICE_BULK_MAX", "1000"))
+# Paginare pentru listarea device-urilor
+DEVICE_PAGE_DEFAULT = int(os.getenv("DEVICE_PAGE_DEFAULT", "100"))
+DEVICE_PAGE_MAX = int(os.getenv("DEVICE_PAGE_MAX", "1000"))
+DEVICE_FIELDS = list(schemas.Device.model_fields)
+
+publisher = RabbitPublisher(host=RABBIT_HOST, name="device-sync-publisher")
+publisher.declare_exchange(EXCHANGE_DEVICE_SYNC, "fanout")
+publisher.declare_queue(QUEUE_DEVICE_SYNC, durable=True)
+publisher.bind_queue(QUEUE_DEVICE_SYNC, EXCHANGE_DEVICE_SYNC)
+
 app = FastAPI(root_path="/devices")
 app.add_middleware(
     CORSMiddleware,
@@ -15,57 +39,177 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=LISTING_HEADERS,
 )
 
 
+@app.on_event("startup")
+def startup_event():
+    publisher.start()
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    # Trimitem ce a rămas în buffer înainte de oprire
+    publisher.close()
+
+
+@app.get("/metrics")
+def get_metrics(admin: dict = Depends(security.require_admin)):
+    return {"publisher": publisher.stats(), "jwt_cache": security.token_cache.stats()}
+
+
 # --- CRUD PENTRU ADMIN SI CLIENT ---
 
 @app.get("/", response_model=List[schemas.Device])
-def read_devices(
-        db: Session = Depends(database.get_db),
+async def read_devices(
+        request: Request,
+        cursor: Optional[int] = Query(None, description="Valoarea X-Next-Cursor din pagina anterioară"),
+        limit: int = Query(DEVICE_PAGE_DEFAULT, ge=1, le=DEVICE_PAGE_MAX),
+        owner_id: Optional[int] = None,
+        address_prefix: Optional[str] = None,
+        min_limit: Optional[float] = Query(None, description="max_hourly_consumption >= min_limit"),
+        max_limit: Optional[float] = Query(None, description="max_hourly_consumption <= max_limit"),
+        fields: Optional[str] = Query(None, description="Coloanele dorite, ex: id,description"),
+        db: AsyncSession = Depends(database.get_async_db),
         current_user: dict = Depends(security.get_current_user_data)
-):
+) -> Response:
     """
     Logica hibridă:
     - Dacă e Admin: Returnează TOATE dispozitivele.
     - Dacă e Client: Returnează doar dispozitivele LUI.
+
+    Paginat după id (keyset): header-ul X-Next-Cursor dă cursorul paginii următoare.
+    Cu `fields` se citesc din DB doar coloanele cerute. ETag / If-None-Match -> 304.
     """
-    if current_user["role"] == "Administrator":
-        return db.query(models.Device).all()
-    else:
+    columns = parse_fields(fields, DEVICE_FIELDS)
+    query = select(*[getattr(models.Device, name) for name in columns])
+    if current_user["role"] != "Administrator":
         # Clientul vede doar device-urile unde owner_id == id-ul lui din token
-        return db.query(models.Device).filter(models.Device.owner_id == current_user["id"]).all()
+        query = query.where(models.Device.owner_id == current_user["id"])
+    if owner_id is not None:
+        query = query.where(models.Device.owner_id == owner_id)
+    if address_prefix:
+        query = query.where(models.Device.address.startswith(address_prefix, autoescape=True))
+    if min_limit is not None:
+        query = query.where(models.Device.max_hourly_consumption >= min_limit)
+    if max_limit is not None:
+        query = query.where(models.Device.max_hourly_consumption <= max_limit)
+    if cursor is not None:
+        query = query.where(models.Device.id > cursor)
+
+    result = await db.execute(query.order_by(models.Device.id).limit(limit + 1))
+    return listing_response(request, [dict(row) for row in result.mappings()], limit)
+
+
+def sync_event(device_id: int, user_id: int, max_consumption: float, operation: str) -> dict:
+    return {
+        "device_id": device_id,
+        "user_id": user_id,
+        "max_hourly_consumption": max_consumption,
+        "operation": operation  # "CREATE", "UPDATE", "DELETE"
+    }
+
+
+def device_sync_event(db_device: models.Device, operation: str) -> dict:
+    return sync_event(db_device.id, db_device.owner_id or 0, db_device.max_hourly_consumption, operation)
 
 
 def send_device_sync(device_id: int, user_id: int, max_consumption: float, operation: str):
-    try:
-        # Ne conectăm la containerul 'rabbitmq' definit în docker-compose
-        connection = pika.BlockingConnection(pika.ConnectionParameters(host='rabbitmq'))
-        channel = connection.channel()
-
-        # Declarăm coada 'device_sync_queue'
-        channel.queue_declare(queue='device_sync_queue', durable=True)
-
-        message = {
-            "device_id": device_id,
-            "user_id": user_id,
-            "max_hourly_consumption": max_consumption,
-            "operation": operation  # "CREATE", "UPDATE", "DELETE"
-        }
-
-        channel.basic_publish(
-            exchange='',
-            routing_key='device_sync_queue',
-            body=json.dumps(message)
-        )
-        connection.close()
-        print(f" [x] Sent sync event for device {device_id}")
-    except Exception as e:
-        print(f"Error connecting to RabbitMQ: {e}")
+    message = sync_event(device_id, user_id, max_consumption, operation)
+
+    # Nu mai deschidem o conexiune per eveniment: mesajul intră în buffer-ul publisher-ului
+    # și e trimis din fundal, pe conexiunea deja deschisă
+    if publisher.publish(routing_key="", body=json.dumps(message), exchange=EXCHANGE_DEVICE_SYNC):
+        print(f" [x] Queued sync event for device {device_id}")
+
+
+def send_device_sync_batch(events: List[dict]):
+    """ Evenimentele unei operații în lot pleacă împreună: {"operation": "BATCH", "events": [...]} """
+    for start in range(0, len(events), DEVICE_SYNC_BATCH_SIZE):
+        chunk = events[start:start + DEVICE_SYNC_BATCH_SIZE]
+        message = {"operation": "BATCH", "events": chunk}
+        if publisher.publish(routing_key="", body=json.dumps(message), exchange=EXCHANGE_DEVICE_SYNC):
+            print(f" [x] Queued batched sync event for {len(chunk)} devices")
+
+
+def check_bulk_size(count: int):
+    if count > DEVICE_BULK_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {DEVICE_BULK_MAX} devices per request")
+
+
+def load_devices(db: Session, ids: List[int]) -> dict:
+    """ Device-urile cerute, într-o singură interogare; 404 (pentru tot lotul) dacă lipsește vreunul """
+    devices = {d.id: d for d in db.query(models.Device).filter(models.Device.id.in_(ids))}
+    missing = sorted(set(ids) - devices.keys())
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Devices not found: {missing}")
+    return devices
 
 
 # --- OPERAȚII DOAR PENTRU ADMIN (Create, Update, Delete, Mapping) ---
 
+# Rutele /bulk sunt declarate înaintea celor cu /{device_id}, altfel "bulk" ar fi tratat ca id
+
+@app.post("/bulk", response_model=List[schemas.Device])
+def create_devices_bulk(devices: List[schemas.DeviceCreate], db: Session = Depends(database.get_db),
+                        admin: dict = Depends(security.require_admin)):
+    """ Creează mai multe device-uri într-o singură tranzacție (ex. provizionarea unei clădiri) """
+    check_bulk_size(len(devices))
+    db_devices = [models.Device(**device.dict()) for device in devices]
+    db.add_all(db_devices)
+    db.flush()  # id-urile noi, fără câte un refresh per device după commit
+
+    created = [schemas.Device.model_validate(d) for d in db_devices]
+    events = [device_sync_event(d, "CREATE") for d in db_devices]
+    db.commit()
+
+    send_device_sync_batch(events)
+    return created
+
+
+@app.put("/bulk", response_model=List[schemas.Device])
+def update_devices_bulk(items: List[schemas.DeviceBulkUpdateItem], db: Session = Depends(database.get_db),
+                        admin: dict = Depends(security.require_admin)):
+    """ Actualizează mai multe device-uri (ex. alt owner_id sau altă limită) într-o singură tranzacție """
+    check_bulk_size(len(items))
+    devices = load_devices(db, [item.id for item in items])
+
+    for item in items:
+        update_data = item.dict(exclude_unset=True)
+        update_data.pop("id")
+        db_device = devices[item.id]
+        for key, value in update_data.items():
+            setattr(db_device, key, value)
+    try:
+        db.flush()
+    except IntegrityError as e:
+        # Plasă de siguranță: null-urile sunt deja refuzate de schemă, cu id-ul device-ului
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"Bulk update violates a constraint: {e.orig}")
+
+    updated = [schemas.Device.model_validate(d) for d in devices.values()]
+    events = [device_sync_event(d, "UPDATE") for d in devices.values()]
+    db.commit()
+
+    send_device_sync_batch(events)
+    return updated
+
+
+@app.post("/bulk/delete")
+def delete_devices_bulk(payload: schemas.DeviceBulkDelete, db: Session = Depends(database.get_db),
+                        admin: dict = Depends(security.require_admin)):
+    """ Șterge mai multe device-uri într-o singură tranzacție (POST: DELETE cu body nu e portabil) """
+    check_bulk_size(len(payload.ids))
+    ids = sorted(load_devices(db, payload.ids))
+    db.query(models.Device).filter(models.Device.id.in_(ids)).delete(synchronize_session=False)
+    db.commit()
+
+    send_device_sync_batch([sync_event(device_id, 0, 0, "DELETE") for device_id in ids])
+    return {"detail": f"{len(ids)} devices deleted"}
+
+
 @app.post("/", response_model=schemas.Device)
 def create_device(device: schemas.DeviceCreate, db: Session = Depends(database.get_db),
                   admin: dict = Depends(security.require_admin)):
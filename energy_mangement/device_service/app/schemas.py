@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, model_validator
+from typing import List, Optional
 
 class DeviceBase(BaseModel):
     description: str
@@ -20,4 +20,21 @@ class Device(DeviceBase):
     owner_id: Optional[int] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# --- Operații în lot (un singur commit, un singur mesaj de sync) ---
+
+class DeviceBulkUpdateItem(DeviceUpdate):
+    id: int
+
+    # Coloane NOT NULL în models.Device: un null explicit e refuzat aici (422), nu la flush (500)
+    @model_validator(mode="after")
+    def reject_nulls(self):
+        nulls = [field for field in ("description", "address", "max_hourly_consumption")
+                 if field in self.model_fields_set and getattr(self, field) is None]
+        if nulls:
+            raise ValueError(f"device {self.id}: {', '.join(nulls)} cannot be null")
+        return self
+
+class DeviceBulkDelete(BaseModel):
+    ids: List[int]
@@ -22,6 +22,12 @@ const ChatComponent = ({ userId, isAdmin }) => {
                 // 1. Încercăm să parsăm mesajul primit (din JSON string în Obiect)
                 const data = JSON.parse(event.data);
 
+                // Heartbeat de la server: răspundem, altfel conexiunea e închisă ca inactivă
+                if (data.type === 'heartbeat') {
+                    ws.current.send(JSON.stringify({ type: 'pong' }));
+                    return;
+                }
+
                 // 2. Verificăm dacă este un mesaj destinat Chat-ului
                 // Ignorăm alertele de senzori care nu au type='chat'
                 if (data.type !== 'chat') {
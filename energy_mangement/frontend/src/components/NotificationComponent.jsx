@@ -22,6 +22,12 @@ const NotificationComponent = () => {
             try {
                 const data = JSON.parse(event.data);
 
+                // Heartbeat de la server: răspundem, altfel conexiunea e închisă ca inactivă
+                if (data.type === 'heartbeat') {
+                    ws.send(JSON.stringify({ type: 'pong' }));
+                    return;
+                }
+
                 // 1. IGNORĂM CHAT-UL (acesta e treaba ChatComponent)
                 if (data.type === 'chat') {
                     return;
@@ -5,12 +5,32 @@ import AuthContext from '../context/AuthContext';
 import ChatComponent from '../components/ChatComponent';
 import { useAuth } from '../context/AuthContext'; // Asigură-te că ai acces la user
 
+// Listele sunt paginate pe server (cursor după id, header X-Next-Cursor)
+const PAGE_SIZE = 50;
+
+const fetchPage = (url, cursor) =>
+    api.get(url, { params: cursor == null ? { limit: PAGE_SIZE } : { limit: PAGE_SIZE, cursor } });
+
+const Pager = ({ pages, next, setPages }) => (
+    <div style={{ marginTop: '10px' }}>
+        <button disabled={pages.length <= 1} onClick={() => setPages(pages.slice(0, -1))} style={{ marginRight: 5 }}>Previous</button>
+        <span style={{ marginRight: 5 }}>Page {pages.length}</span>
+        <button disabled={next == null} onClick={() => setPages([...pages, next])}>Next</button>
+    </div>
+);
+
 const AdminDashboard = () => {
     const { user, logout } = useAuth();
     const [users, setUsers] = useState([]);
     const [devices, setDevices] = useState([]);
     const [activeTab, setActiveTab] = useState('users');
 
+    // Cursorul fiecărei pagini vizitate (null = prima pagină); ultima e pagina curentă
+    const [userPages, setUserPages] = useState([null]);
+    const [devicePages, setDevicePages] = useState([null]);
+    const [userNext, setUserNext] = useState(null);
+    const [deviceNext, setDeviceNext] = useState(null);
+
     // Formulare
     const [userForm, setUserForm] = useState({ id: null, username: '', password: '', role: 'Client' });
     const [deviceForm, setDeviceForm] = useState({ id: null, description: '', address: '', max_hourly_consumption: 0, owner_id: '' });
@@ -21,17 +41,19 @@ const AdminDashboard = () => {
     const fetchData = async () => {
         try {
             const [usersRes, devicesRes] = await Promise.all([
-                api.get('/users/'),
-                api.get('/devices/')
+                fetchPage('/users/', userPages[userPages.length - 1]),
+                fetchPage('/devices/', devicePages[devicePages.length - 1])
             ]);
             setUsers(usersRes.data);
             setDevices(devicesRes.data);
+            setUserNext(usersRes.headers['x-next-cursor'] ?? null);
+            setDeviceNext(devicesRes.headers['x-next-cursor'] ?? null);
         } catch (error) {
             console.error(error);
         }
     };
 
-    useEffect(() => { fetchData(); }, []);
+    useEffect(() => { fetchData(); }, [userPages, devicePages]);
 
     // --- USER HANDLERS ---
     const handleEditUserClick = (user) => {
@@ -145,6 +167,7 @@ const AdminDashboard = () => {
                             ))}
                         </tbody>
                     </table>
+                    <Pager pages={userPages} next={userNext} setPages={setUserPages} />
                 </>
             )}
 
@@ -176,6 +199,7 @@ const AdminDashboard = () => {
                             ))}
                         </tbody>
                     </table>
+                    <Pager pages={devicePages} next={deviceNext} setPages={setDevicePages} />
                 </>
             )}
             <ChatComponent userId={user?.id} isAdmin={true} />
@@ -20,9 +20,15 @@ const ClientDashboard = () => {
         const fetchDevices = async () => {
             try {
                 // Backend-ul returnează automat doar dispozitivele userului logat
-                // bazat pe ID-ul din token
-                const response = await api.get('/devices/');
-                setDevices(response.data);
+                // bazat pe ID-ul din token. Lista e paginată: urmăm X-Next-Cursor până la capăt
+                const all = [];
+                let cursor = null;
+                do {
+                    const response = await api.get('/devices/', { params: cursor == null ? {} : { cursor } });
+                    all.push(...response.data);
+                    cursor = response.headers['x-next-cursor'] ?? null;
+                } while (cursor != null);
+                setDevices(all);
             } catch (err) {
                 console.error(err);
                 setError('Could not load devices.');
@@ -15,6 +15,16 @@ import {
 
 ChartJS.register(CategoryScale, LinearScale, PointElement, LineElement, Title, Tooltip, Legend);
 
+// Fiecare mod de vizualizare cere de la server rezoluția și numărul de bucket-uri necesare
+const VIEW_QUERIES = {
+    // Last 2h, interval 10 min
+    recent: { resolution: '10m', limit: 12, label: 'Consumption (Last 2 Hours)', color: 'rgb(75, 192, 192)' },
+    // Last 24h, agregat pe oră
+    hourly: { resolution: '1h', limit: 24, label: 'Hourly Consumption (Last 24 Hours)', color: 'rgb(54, 162, 235)' },
+    // Ultimul an, agregat pe zi
+    daily: { resolution: '1d', limit: 365, label: 'Total Daily Consumption', color: 'rgb(255, 99, 132)', daily: true },
+};
+
 const DeviceHistory = () => {
     const { deviceId } = useParams();
     const navigate = useNavigate();
@@ -23,117 +33,108 @@ const DeviceHistory = () => {
     const [chartData, setChartData] = useState(null);
     const [loading, setLoading] = useState(true);
 
-    // viewMode: 'recent' (Last 2h), 'hourly' (Last 24h), 'daily' (All time)
+    // viewMode: 'recent' (Last 2h), 'hourly' (Last 24h), 'daily' (Last year)
     const [viewMode, setViewMode] = useState('recent');
 
     // 1. Fetch Data
+    // Agregarea se face pe server: cerem doar bucket-urile de care are nevoie graficul.
+    // Istoricul se citește o singură dată; actualizările vin apoi prin WebSocket (fără polling).
     useEffect(() => {
+        const { resolution, limit } = VIEW_QUERIES[viewMode];
+        let cancelled = false;
+        // Update-urile sosite înainte de istoric așteaptă aici, ca să nu fie suprascrise de el
+        let pending = [];
+
+        // Update-ul poartă totalul curent al bucket-ului (nu doar delta), deci aplicarea e idempotentă:
+        // un update deja inclus în istoric (sau primit de două ori) nu mai adaugă nimic.
+        // Totalurile doar cresc, așa că un update mai vechi decât istoricul nu îl poate micșora.
+        const applyUpdate = (update) => {
+            const period = resolution === '10m'
+                ? { timestamp: update.timestamp, total_consumption: update.total_consumption }
+                : update.periods?.[resolution];
+            if (!period) return;
+            setRawData(prev => {
+                const index = prev.findIndex(r => r.timestamp === period.timestamp);
+                if (index >= 0) {
+                    const next = [...prev];
+                    next[index] = { ...next[index], total_consumption: Math.max(next[index].total_consumption, period.total_consumption) };
+                    return next;
+                }
+                const added = [...prev, { device_id: update.device_id, timestamp: period.timestamp, total_consumption: period.total_consumption }];
+                added.sort((a, b) => a.timestamp - b.timestamp);
+                return added.slice(-limit);
+            });
+        };
+
         const fetchHistory = async () => {
             try {
-                const response = await api.get(`/monitoring/consumption/${deviceId}`);
-                setRawData(response.data);
+                const response = await api.get(`/monitoring/consumption/${deviceId}`, {
+                    params: { resolution, limit, order: 'desc' },
+                });
+                // Serverul întoarce cele mai noi bucket-uri primele; graficul le vrea cronologic
+                if (!cancelled) setRawData([...response.data].reverse());
             } catch (error) {
                 console.error("Error fetching history", error);
             } finally {
-                setLoading(false);
+                if (!cancelled) {
+                    setLoading(false);
+                    pending.forEach(applyUpdate);
+                    pending = null;
+                }
             }
         };
 
-        // Apelăm imediat
         fetchHistory();
 
-        // Setăm intervalul de 3 secunde
-        const intervalId = setInterval(fetchHistory, 3000);
+        // Flux live: totalurile noi pentru acest device
+        const ws = new WebSocket('ws://localhost/ws/consumption');
+        ws.onopen = () => ws.send(JSON.stringify({ action: 'subscribe', device_id: Number(deviceId) }));
+        ws.onmessage = (event) => {
+            try {
+                const update = JSON.parse(event.data);
+                // Heartbeat de la server: răspundem, altfel conexiunea e închisă ca inactivă
+                if (update.type === 'heartbeat') {
+                    ws.send(JSON.stringify({ type: 'pong' }));
+                    return;
+                }
+                if (update.type !== 'consumption') return;
+
+                if (pending) pending.push(update);
+                else applyUpdate(update);
+            } catch (error) {
+                // Ignorăm mesajele invalide
+            }
+        };
 
-        // Curățăm intervalul când ieșim de pe pagină
-        return () => clearInterval(intervalId);
-    }, [deviceId]);
+        // Închidem fluxul când ieșim de pe pagină sau schimbăm modul
+        return () => {
+            cancelled = true;
+            ws.close();
+        };
+    }, [deviceId, viewMode]);
 
     // 2. Procesare Date
     useEffect(() => {
         if (!rawData.length) return;
 
-        let processedLabels = [];
-        let processedValues = [];
-        let labelText = '';
-        let lineColor = '';
-
-        // Luăm ultimul timestamp disponibil ca referință ("Acum")
-        const lastRecord = rawData[rawData.length - 1];
-        const lastTimestamp = lastRecord.timestamp;
-
-        if (viewMode === 'recent') {
-            // --- MODUL RECENT (Last 2 Hours, interval 10 min) ---
-            labelText = 'Consumption (Last 2 Hours)';
-            lineColor = 'rgb(75, 192, 192)'; // Turcoaz
-
-            const twoHoursAgo = lastTimestamp - (2 * 60 * 60 * 1000);
-            const recentData = rawData.filter(r => r.timestamp >= twoHoursAgo);
-
-            processedLabels = recentData.map(record => {
-                const date = new Date(record.timestamp);
-                return date.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
-            });
-            processedValues = recentData.map(record => record.total_consumption);
+        const { label, color, daily } = VIEW_QUERIES[viewMode];
 
-        } else if (viewMode === 'hourly') {
-            // --- MODUL ORAR (Last 24 Hours, agregat pe oră) ---
-            labelText = 'Hourly Consumption (Last 24 Hours)';
-            lineColor = 'rgb(54, 162, 235)'; // Albastru
-
-            // 1. Calculăm fereastra de 24h
-            const twentyFourHoursAgo = lastTimestamp - (24 * 60 * 60 * 1000);
-
-            // 2. Filtrăm doar datele din ultima zi
-            const lastDayData = rawData.filter(r => r.timestamp >= twentyFourHoursAgo);
-
-            // 3. Agregăm datele filtrate pe ore
-            const hourlyGroups = {};
-            lastDayData.forEach(record => {
-                const date = new Date(record.timestamp);
-                date.setMinutes(0, 0, 0);
-                const key = date.getTime();
-
-                if (!hourlyGroups[key]) hourlyGroups[key] = 0;
-                hourlyGroups[key] += record.total_consumption;
-            });
-
-            const sortedKeys = Object.keys(hourlyGroups).sort();
-            processedLabels = sortedKeys.map(timestamp => {
-                return new Date(parseInt(timestamp)).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
-            });
-            processedValues = sortedKeys.map(key => hourlyGroups[key]);
-
-        } else if (viewMode === 'daily') {
-            // --- MODUL ZILNIC (Tot istoricul, agregat pe zi) ---
-            labelText = 'Total Daily Consumption (All Time)';
-            lineColor = 'rgb(255, 99, 132)'; // Roșu
-
-            const dailyGroups = {};
-            rawData.forEach(record => {
-                const date = new Date(record.timestamp);
-                date.setHours(0, 0, 0, 0);
-                const key = date.getTime();
-
-                if (!dailyGroups[key]) dailyGroups[key] = 0;
-                dailyGroups[key] += record.total_consumption;
-            });
-
-            const sortedKeys = Object.keys(dailyGroups).sort();
-            processedLabels = sortedKeys.map(timestamp => {
-                return new Date(parseInt(timestamp)).toLocaleDateString();
-            });
-            processedValues = sortedKeys.map(key => dailyGroups[key]);
-        }
+        const processedLabels = rawData.map(record => {
+            const date = new Date(record.timestamp);
+            return daily
+                ? date.toLocaleDateString()
+                : date.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
+        });
+        const processedValues = rawData.map(record => record.total_consumption);
 
         setChartData({
             labels: processedLabels,
             datasets: [
                 {
-                    label: labelText,
+                    label: label,
                     data: processedValues,
-                    borderColor: lineColor,
-                    backgroundColor: lineColor.replace('rgb', 'rgba').replace(')', ', 0.5)'),
+                    borderColor: color,
+                    backgroundColor: color.replace('rgb', 'rgba').replace(')', ', 0.5)'),
                     tension: 0.3,
                     pointRadius: 5,
                 },
@@ -176,7 +177,7 @@ const DeviceHistory = () => {
                         Last 24 Hours
                     </button>
                     <button style={btnStyle('daily')} onClick={() => setViewMode('daily')}>
-                        Daily (All)
+                        Daily
                     </button>
                 </div>
             </div>
@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import crud, models
+
+# Praguri de escaladare, ca multipli ai limitei (ex: "1.0,1.5,2.0" -> 100%, 150%, 200%)
+ALERT_TIERS = sorted(float(t) for t in os.getenv("ALERT_TIERS", "1.0").split(",") if t.strip())
+# Pauza minimă (secunde) între alertele unui device pentru intervale noi; escaladările o ignoră
+ALERT_COOLDOWN_SECONDS = float(os.getenv("ALERT_COOLDOWN_SECONDS", "0"))
+
+
+class AlertTracker:
+    """
+    Ține minte, per device, intervalul curent și cel mai mare prag deja anunțat,
+    astfel încât fiecare depășire de prag să genereze o singură notificare.
+    Starea e scrisă în tabela 'alert_state' și reîncărcată de acolo la pornire.
+    """
+
+    def __init__(self, tiers: List[float] = ALERT_TIERS, cooldown_seconds: float = ALERT_COOLDOWN_SECONDS):
+        self.tiers = tiers or [1.0]
+        self.cooldown_seconds = cooldown_seconds
+        # device_id -> (interval_timestamp, tier_anunțat, last_sent_at în ms)
+        self._state: Dict[int, Tuple[int, int, int]] = {}
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.suppressed = 0
+
+    def load(self, db: Session):
+        rows = db.query(models.AlertState).all()
+        with self._lock:
+            self._state = {r.device_id: (r.interval_timestamp, r.tier, r.last_sent_at) for r in rows}
+        print(f" [ALERT] Restored alert state for {len(rows)} devices", flush=True)
+
+    def tier_for(self, current_total: float, max_limit: float) -> int:
+        """ Câte praguri au fost depășite (0 = niciunul) """
+        return sum(1 for factor in self.tiers if current_total > max_limit * factor)
+
+    def should_alert(self, device_id: int, interval_timestamp: int, current_total: float,
+                     max_limit: float) -> Optional[int]:
+        """ Returnează pragul (1..N) care trebuie anunțat acum, sau None """
+        tier = self.tier_for(current_total, max_limit)
+        if tier == 0:
+            return None
+
+        with self._lock:
+            last_interval, last_tier, last_sent_at = self._state.get(device_id, (None, 0, 0))
+
+        if last_interval is not None and interval_timestamp < last_interval:
+            # Citire întârziată pentru un interval mai vechi: a fost deja tratat
+            return None
+
+        if interval_timestamp == last_interval:
+            if tier <= last_tier:
+                return None
+            return tier  # escaladare în același interval
+
+        now_ms = int(time.time() * 1000)
+        if self.cooldown_seconds and now_ms - last_sent_at < self.cooldown_seconds * 1000:
+            self.suppressed += 1
+            return None
+        return tier
+
+    def record(self, db: Session, device_id: int, interval_timestamp: int, tier: int):
+        """ Salvează (și face commit) că pragul a fost anunțat, înainte de a trimite notificarea """
+        now_ms = int(time.time() * 1000)
+        crud.upsert_alert_state(db, device_id, interval_timestamp, tier, now_ms)
+        db.commit()
+        with self._lock:
+            self._state[device_id] = (interval_timestamp, tier, now_ms)
+            self.sent += 1
+
+    def forget(self, device_id: int):
+        with self._lock:
+            self._state.pop(device_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            tracked = len(self._state)
+        return {
+            "tiers": self.tiers,
+            "cooldown_seconds": self.cooldown_seconds,
+            "tracked_devices": tracked,
+            "sent": self.sent,
+            "suppressed": self.suppressed,
+        }
+
+
+alert_tracker = AlertTracker()
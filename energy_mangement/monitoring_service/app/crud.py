@@ -0,0 +1,232 @@
+import os
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models
+
+BucketKey = Tuple[int, int]  # (device_id, interval_timestamp)
+ReadingKey = Tuple[int, int, int]  # (device_id, timestamp-ul citirii, hash-ul citirii)
+
+DAY_MS = 24 * 60 * 60 * 1000
+WEEK_MS = 7 * DAY_MS
+# 1970-01-01 (epoch) a fost joi: decalăm cu 4 zile ca săptămânile să înceapă lunea, 00:00 UTC
+WEEK_OFFSET_MS = 4 * DAY_MS
+
+# Lățimea bucket-urilor brute din hourly_consumption (10, 15 sau 60 de minute; rotunjire în UTC).
+# Trebuie să dividă ora, ca rollup-urile să rămână exacte. Nu se schimbă pe o bază cu date existente.
+BUCKET_WIDTH_MINUTES = int(os.getenv("BUCKET_WIDTH_MINUTES", "10"))
+if BUCKET_WIDTH_MINUTES <= 0 or 60 % BUCKET_WIDTH_MINUTES:
+    raise ValueError(f"BUCKET_WIDTH_MINUTES must divide 60, got {BUCKET_WIDTH_MINUTES}")
+BUCKET_WIDTH_MS = BUCKET_WIDTH_MINUTES * 60 * 1000
+NATIVE_RESOLUTION = f"{BUCKET_WIDTH_MINUTES}m"
+
+# Rezoluțiile acceptate de API-ul de istoric:
+# (tabela sursă, lățimea de grupare în ms sau None, decalajul grupării față de epoch)
+RESOLUTION_SOURCES = {
+    NATIVE_RESOLUTION: (models.HourlyConsumption, None, 0),
+    "1h": (models.HourlyRollup, None, 0),
+    "1d": (models.DailyRollup, None, 0),
+    "1w": (models.DailyRollup, WEEK_MS, WEEK_OFFSET_MS),
+    "1mo": (models.MonthlyRollup, None, 0),
+}
+
+# Câte bucket-uri punem într-un singur INSERT (limita de parametri SQLite e 999 pe versiunile vechi)
+UPSERT_CHUNK_SIZE = 300
+
+
+def _insert_for(db: Session):
+    """ INSERT ... ON CONFLICT există doar în dialectele PostgreSQL și SQLite """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    raise RuntimeError(f"UPSERT not supported for dialect '{dialect}'")
+
+
+def upsert_increment(db: Session, table, folded: Dict[BucketKey, float],
+                     returning: bool = True) -> Dict[BucketKey, float]:
+    """
+    Adună consumul în `table` (cheie unică device_id + timestamp) cu un singur statement atomic:
+        INSERT ... ON CONFLICT (device_id, timestamp)
+        DO UPDATE SET total_consumption = total_consumption + excluded.total_consumption
+        RETURNING total_consumption
+    Nu face commit. Returnează totalul nou pentru fiecare cheie atinsă (dacă `returning`).
+    """
+    if not folded:
+        return {}
+
+    insert = _insert_for(db)
+    items = list(folded.items())
+    totals: Dict[BucketKey, float] = {}
+
+    for start in range(0, len(items), UPSERT_CHUNK_SIZE):
+        rows = [
+            {"device_id": device_id, "timestamp": timestamp, "total_consumption": delta}
+            for (device_id, timestamp), delta in items[start:start + UPSERT_CHUNK_SIZE]
+        ]
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.device_id, table.c.timestamp],
+            set_={"total_consumption": table.c.total_consumption + stmt.excluded.total_consumption},
+        )
+        if not returning:
+            db.execute(stmt)
+            continue
+
+        stmt = stmt.returning(table.c.device_id, table.c.timestamp, table.c.total_consumption)
+        for row in db.execute(stmt):
+            totals[(row.device_id, row.timestamp)] = row.total_consumption
+
+    return totals
+
+
+def upsert_buckets(db: Session, folded: Dict[BucketKey, float]) -> Dict[BucketKey, float]:
+    """ UPSERT pe bucket-urile brute (BUCKET_WIDTH_MINUTES) din hourly_consumption """
+    return upsert_increment(db, models.HourlyConsumption.__table__, folded)
+
+
+def claim_readings(db: Session, keys: List[ReadingKey]) -> Set[ReadingKey]:
+    """
+    Înregistrează id-urile (device_id, timestamp, hash) ale citirilor și le returnează doar pe cele noi
+    (INSERT ... ON CONFLICT DO NOTHING RETURNING). Nu face commit: dacă tranzacția cade,
+    citirile rămân nerevendicate și pot fi reprocesate.
+    """
+    if not keys:
+        return set()
+
+    insert = _insert_for(db)
+    table = models.ProcessedReading.__table__
+    claimed: Set[ReadingKey] = set()
+    for start in range(0, len(keys), UPSERT_CHUNK_SIZE):
+        chunk = keys[start:start + UPSERT_CHUNK_SIZE]
+        stmt = insert(table).values([{"device_id": d, "timestamp": ts, "reading_hash": h} for d, ts, h in chunk])
+        stmt = stmt.on_conflict_do_nothing(
+            index_elements=[table.c.device_id, table.c.timestamp, table.c.reading_hash]
+        )
+        for row in db.execute(stmt.returning(table.c.device_id, table.c.timestamp, table.c.reading_hash)):
+            claimed.add((row.device_id, row.timestamp, row.reading_hash))
+    return claimed
+
+
+def consumption_query(device_id: int, resolution: str, from_ts: Optional[int], to_ts: Optional[int],
+                      cursor: Optional[int], limit: int, descending: bool):
+    """
+    SELECT-ul pentru istoricul unui device pe fereastra [from_ts, to_ts), la rezoluția cerută.
+    1h/1d/1mo se citesc direct din tabelele de rollup; 1w se agregă în SQL din rollup-ul zilnic.
+    `cursor` e începutul ultimului bucket din pagina anterioară; cel mult `limit` rânduri.
+    """
+    table, width, offset = RESOLUTION_SOURCES[resolution]
+
+    if width is None:
+        # Rândurile sursei sunt deja bucket-urile cerute, nu mai grupăm
+        bucket = table.timestamp
+        total = table.total_consumption
+    else:
+        bucket = ((table.timestamp - offset) // width) * width + offset
+        total = func.sum(table.total_consumption)
+
+    query = select(bucket.label("timestamp"), total.label("total_consumption")).where(
+        table.device_id == device_id
+    )
+    if from_ts is not None:
+        query = query.where(table.timestamp >= from_ts)
+    if to_ts is not None:
+        query = query.where(table.timestamp < to_ts)
+    if cursor is not None:
+        if descending:
+            query = query.where(table.timestamp < cursor)
+        elif width is None:
+            query = query.where(table.timestamp > cursor)
+        else:
+            # Bucket-urile sunt aliniate la `width`, deci pagina următoare începe la bucket-ul vecin
+            query = query.where(table.timestamp >= cursor + width)
+
+    if width is not None:
+        query = query.group_by(bucket)
+
+    return query.order_by(bucket.desc() if descending else bucket).limit(limit)
+
+
+async def query_consumption(db: AsyncSession, device_id: int, resolution: str, from_ts: Optional[int],
+                            to_ts: Optional[int], cursor: Optional[int], limit: int,
+                            descending: bool) -> List[dict]:
+    query = consumption_query(device_id, resolution, from_ts, to_ts, cursor, limit, descending)
+    rows = await db.execute(query)
+    return [
+        {"device_id": device_id, "timestamp": row.timestamp, "total_consumption": row.total_consumption}
+        for row in rows
+    ]
+
+
+def upsert_alert_state(db: Session, device_id: int, interval_timestamp: int, tier: int, sent_at: int):
+    """ Scrie starea alertei pentru un device (nu face commit) """
+    insert = _insert_for(db)
+    values = {"interval_timestamp": interval_timestamp, "tier": tier, "last_sent_at": sent_at}
+    stmt = insert(models.AlertState.__table__).values(device_id=device_id, **values)
+    db.execute(stmt.on_conflict_do_update(index_elements=["device_id"], set_=values))
+
+
+def apply_device_sync(db: Session, upserts: Dict[int, dict], deletes: Set[int]):
+    """
+    Aplică un lot de evenimente de sync pe monitored_devices: un UPSERT pentru toate
+    CREATE/UPDATE și un DELETE ... IN pentru ștergeri. Nu face commit.
+    `upserts`: device_id -> {"user_id", "max_hourly_consumption"}
+    """
+    table = models.MonitoredDevice.__table__
+    items = list(upserts.items())
+    if items:
+        insert = _insert_for(db)
+    for start in range(0, len(items), UPSERT_CHUNK_SIZE):
+        stmt = insert(table).values([
+            {"device_id": device_id, "user_id": values["user_id"],
+             "max_hourly_consumption": values["max_hourly_consumption"]}
+            for device_id, values in items[start:start + UPSERT_CHUNK_SIZE]
+        ])
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.device_id],
+            set_={"user_id": stmt.excluded.user_id, "max_hourly_consumption": stmt.excluded.max_hourly_consumption},
+        ))
+
+    ids = sorted(deletes)
+    for start in range(0, len(ids), UPSERT_CHUNK_SIZE):
+        db.execute(table.delete().where(table.c.device_id.in_(ids[start:start + UPSERT_CHUNK_SIZE])))
+
+
+def ensure_bucket_unique_index(engine):
+    """
+    create_all() nu modifică tabelele deja existente.
+    Pentru baze vechi (hourly_consumption cu coloană `id`): comasăm duplicatele (device_id, timestamp)
+    și creăm indexul unic, fără de care ON CONFLICT nu funcționează.
+    În PostgreSQL tabela veche e înlocuită oricum de cea partiționată (partitions.migrate).
+    """
+    columns = {column["name"] for column in inspect(engine).get_columns("hourly_consumption")}
+    existing = {ix["name"] for ix in inspect(engine).get_indexes("hourly_consumption")}
+    if "id" not in columns or "ix_hourly_consumption_device_ts" in existing:
+        return
+
+    print(" [DB] Creating unique (device_id, timestamp) index on hourly_consumption...", flush=True)
+    with engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE hourly_consumption SET total_consumption = (
+                SELECT SUM(h2.total_consumption) FROM hourly_consumption h2
+                WHERE h2.device_id = hourly_consumption.device_id
+                  AND h2.timestamp = hourly_consumption.timestamp
+            )
+            WHERE id IN (
+                SELECT MIN(id) FROM hourly_consumption
+                GROUP BY device_id, timestamp HAVING COUNT(*) > 1
+            )
+        """))
+        conn.execute(text("""
+            DELETE FROM hourly_consumption WHERE id NOT IN (
+                SELECT MIN(id) FROM hourly_consumption GROUP BY device_id, timestamp
+            )
+        """))
+        conn.execute(text(
+            "CREATE UNIQUE INDEX ix_hourly_consumption_device_ts ON hourly_consumption (device_id, timestamp)"
+        ))
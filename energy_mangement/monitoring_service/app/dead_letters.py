@@ -0,0 +1,84 @@
+"""
+Operații pe coada de mesaje moarte a senzorilor (sensor_data.dlq).
+
+    python -m app.dead_letters stats
+    python -m app.dead_letters replay [--limit N] [--batch 500]
+
+Replay-ul golește DLQ-ul în loturi, prin același drum de scriere ca și consumatorii
+(dedup pe device_id + timestamp + hash-ul citirii), deci poate fi rulat de mai multe ori fără dublă numărare.
+Mesajele care eșuează din nou ajung la coada DLQ-ului; sunt procesate doar mesajele
+existente la pornire, așa că replay-ul se termină mereu.
+"""
+import argparse
+import os
+
+import pika
+
+from . import database, ingestion, models
+from shared.sensor_topology import SENSOR_DLQ, declare_dead_letter_topology
+
+RABBIT_HOST = os.getenv("RABBIT_HOST", "rabbitmq")
+
+
+def _connect():
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBIT_HOST))
+    channel = connection.channel()
+    channel.confirm_delivery()
+    declare_dead_letter_topology(channel)
+    return connection, channel
+
+
+def pending_count(channel) -> int:
+    return channel.queue_declare(queue=SENSOR_DLQ, durable=True, passive=True).method.message_count
+
+
+def replay(limit: int = 0, batch_size: int = ingestion.SENSOR_BATCH_SIZE) -> int:
+    """ Reprocesează cel mult `limit` mesaje din DLQ (0 = toate cele prezente acum) """
+    connection, channel = _connect()
+    try:
+        total = pending_count(channel)
+        if limit:
+            total = min(total, limit)
+        print(f" [DLQ] Replaying {total} messages from {SENSOR_DLQ}...", flush=True)
+
+        # Datele reluate sunt istorice: fără alerte sau live update-uri
+        batcher = ingestion.SensorBatcher(channel, SENSOR_DLQ, on_flushed=lambda db, folded, totals, period_totals: None,
+                                          batch_size=batch_size)
+        replayed = 0
+        while replayed < total:
+            method, properties, body = channel.basic_get(queue=SENSOR_DLQ)
+            if method is None:
+                break
+            batcher.add(method, properties, body)
+            replayed += 1
+        batcher.flush()
+
+        print(f" [DLQ] Replay done: {replayed} messages processed, {pending_count(channel)} left in DLQ.",
+              flush=True)
+        return replayed
+    finally:
+        if connection.is_open:
+            connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or replay the sensor dead-letter queue")
+    parser.add_argument("command", choices=["stats", "replay"])
+    parser.add_argument("--limit", type=int, default=0, help="replay at most N messages (0 = all)")
+    parser.add_argument("--batch", type=int, default=ingestion.SENSOR_BATCH_SIZE, help="readings per write")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        connection, channel = _connect()
+        try:
+            print(f" [DLQ] {pending_count(channel)} messages in {SENSOR_DLQ}", flush=True)
+        finally:
+            connection.close()
+        return
+
+    models.Base.metadata.create_all(bind=database.engine)
+    replay(limit=args.limit, batch_size=args.batch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from . import models
+
+DEVICE_CACHE_SIZE = int(os.getenv("DEVICE_CACHE_SIZE", "100000"))
+
+# Aceleași nume de câmpuri ca MonitoredDevice, ca să poată fi folosit în locul rândului din DB
+DeviceLimit = namedtuple("DeviceLimit", ["device_id", "user_id", "max_hourly_consumption"])
+
+# Marcăm și device-urile care NU există, ca să nu le căutăm în DB la fiecare citire
+_MISSING = object()
+
+
+class DeviceLimitCache:
+    """
+    Cache LRU (în proces) cu limitele device-urilor monitorizate.
+    Se încarcă la pornire, e ținut la zi de process_sync_message și
+    cade pe DB doar la miss.
+    """
+
+    def __init__(self, maxsize: int = DEVICE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[int, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db_reads = 0
+        self.evictions = 0
+
+    def load_all(self, db: Session):
+        rows = db.query(models.MonitoredDevice).limit(self.maxsize).all()
+        with self._lock:
+            self._entries.clear()
+            for row in rows:
+                self._entries[row.device_id] = self._from_row(row)
+            self.db_reads += 1
+        print(f" [CACHE] Loaded {len(rows)} monitored devices", flush=True)
+
+    def get(self, device_id: int, db: Session) -> Optional[DeviceLimit]:
+        return self.get_many([device_id], db).get(device_id)
+
+    def get_many(self, device_ids: Iterable[int], db: Session) -> Dict[int, DeviceLimit]:
+        """ Returnează limitele pentru device-urile cerute; miss-urile se citesc dintr-un singur SELECT """
+        found: Dict[int, DeviceLimit] = {}
+        missing = []
+
+        with self._lock:
+            for device_id in set(device_ids):
+                entry = self._entries.get(device_id)
+                if entry is None:
+                    missing.append(device_id)
+                    continue
+                self._entries.move_to_end(device_id)
+                self.hits += 1
+                if entry is not _MISSING:
+                    found[device_id] = entry
+            self.misses += len(missing)
+
+        if missing:
+            rows = db.query(models.MonitoredDevice).filter(
+                models.MonitoredDevice.device_id.in_(missing)
+            ).all()
+            loaded = {row.device_id: self._from_row(row) for row in rows}
+            with self._lock:
+                self.db_reads += 1
+                for device_id in missing:
+                    self._store(device_id, loaded.get(device_id, _MISSING))
+            found.update(loaded)
+
+        return found
+
+    def put(self, device_id: int, user_id: int, max_hourly_consumption: Optional[float]):
+        with self._lock:
+            self._store(device_id, DeviceLimit(device_id, user_id, max_hourly_consumption))
+
+    def evict(self, device_id: int):
+        with self._lock:
+            self._entries.pop(device_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "db_reads": self.db_reads,
+                "evictions": self.evictions,
+            }
+
+    def _store(self, device_id: int, entry):
+        # Apelat doar cu lock-ul luat
+        self._entries[device_id] = entry
+        self._entries.move_to_end(device_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    @staticmethod
+    def _from_row(row) -> DeviceLimit:
+        return DeviceLimit(row.device_id, row.user_id, row.max_hourly_consumption)
+
+
+device_limits = DeviceLimitCache()
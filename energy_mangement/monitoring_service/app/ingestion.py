@@ -0,0 +1,272 @@
+import hashlib
+import os
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pika
+from sqlalchemy.exc import DisconnectionError, OperationalError
+
+from . import crud, database, partitions, rollups
+from .crud import BUCKET_WIDTH_MS, BucketKey
+from shared import sensor_codec
+from shared.sensor_topology import SENSOR_DLX, declare_dead_letter_topology
+
+# Config ingestie în loturi (batch)
+SENSOR_BATCH_SIZE = int(os.getenv("SENSOR_BATCH_SIZE", "500"))
+SENSOR_FLUSH_INTERVAL_MS = int(os.getenv("SENSOR_FLUSH_INTERVAL_MS", "250"))
+# Câte mesaje neconfirmate ține broker-ul "în zbor" pentru noi (implicit 2 loturi)
+SENSOR_PREFETCH = int(os.getenv("SENSOR_PREFETCH", str(SENSOR_BATCH_SIZE * 2)))
+
+
+def compute_interval_start(timestamp_ms: int) -> int:
+    """ Rotunjește timestamp-ul (ms) în jos la începutul bucket-ului (UTC, fără datetime/fus orar) """
+    return timestamp_ms - timestamp_ms % BUCKET_WIDTH_MS
+
+
+def parse_readings(properties, body: bytes) -> List[Tuple[int, int, float]]:
+    """ Un mesaj poate fi JSON (o citire) sau un frame binar cu mai multe citiri (după content_type) """
+    content_type = properties.content_type if properties is not None else None
+    return sensor_codec.decode(body, content_type)
+
+
+def reading_hash(device_id: int, timestamp: int, value: float) -> int:
+    """ Id-ul unei citiri pentru dedup: primii 64 de biți (cu semn, cât încape în BIGINT) din blake2b """
+    digest = hashlib.blake2b(sensor_codec.RECORD.pack(device_id, timestamp, float(value)), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def fold_readings(readings: List[Tuple[int, int, float]]) -> Dict[BucketKey, float]:
+    """
+    Însumează citirile din lot pe (device_id, bucket), vectorizat: rotunjirea la bucket,
+    gruparea și suma se fac în NumPy peste tot lotul, nu citire cu citire.
+    """
+    if not readings:
+        return {}
+
+    device_ids, timestamps, values = zip(*readings)
+    device_ids = np.array(device_ids, dtype=np.int64)
+    slots = np.array(timestamps, dtype=np.int64) // BUCKET_WIDTH_MS
+
+    # O singură cheie int64 per citire: device_id în biții de sus, indexul bucket-ului în cei 32 de jos
+    keys, inverse = np.unique((device_ids << 32) | slots, return_inverse=True)
+    sums = np.bincount(inverse, weights=np.array(values, dtype=np.float64), minlength=len(keys))
+    return {
+        (key >> 32, (key & 0xFFFFFFFF) * BUCKET_WIDTH_MS): total
+        for key, total in zip(keys.tolist(), sums.tolist())
+    }
+
+
+def ingest_readings(db, readings: List[Tuple[int, int, float]]
+                    ) -> Tuple[Dict[BucketKey, float], Dict[BucketKey, float], rollups.PeriodTotals]:
+    """
+    Scrie citirile într-o singură tranzacție: revendică id-urile lor (device_id, timestamp, hash),
+    apoi UPSERT pe bucket-uri + rollup-uri orare/zilnice/lunare doar pentru citirile noi.
+    Citirile deja numărate (relivrări, replay) sunt ignorate. Mesajele se confirmă DUPĂ commit.
+    Returnează (delta-urile aplicate, totalurile noi) pe (device_id, interval) și totalurile noi
+    ale rollup-urilor atinse, per rezoluție ("1h", "1d", "1mo").
+    """
+    unique = {}
+    for reading in readings:
+        unique.setdefault((reading[0], reading[1], reading_hash(*reading)), reading)
+
+    claimed = crud.claim_readings(db, list(unique))
+    fresh = [reading for key, reading in unique.items() if key in claimed]
+    if len(fresh) < len(readings):
+        print(f" [DEDUP] Skipped {len(readings) - len(fresh)} already processed readings", flush=True)
+
+    folded = fold_readings(fresh)
+    # Citirile mai vechi decât retenția brută ajung direct (doar) în rollup-uri
+    horizon = partitions.raw_horizon()
+    raw = folded if horizon is None else {key: delta for key, delta in folded.items() if key[1] >= horizon}
+    partitions.ensure_months(db, (timestamp for _, timestamp in raw))
+    totals = crud.upsert_buckets(db, raw)
+    period_totals = rollups.apply(db, folded, returning=True)
+    db.commit()
+    return folded, totals, period_totals
+
+
+def dead_letter(channel, queue_name: str, properties, body: bytes, reason: str):
+    """ Mută mesajul în DLQ (cu motivul în header), pentru inspecție și replay """
+    headers = dict(properties.headers or {}) if properties is not None else {}
+    headers["x-dead-letter-reason"] = reason[:500]
+    # La replay din DLQ păstrăm coada de origine
+    headers.setdefault("x-original-queue", queue_name)
+    channel.basic_publish(
+        exchange=SENSOR_DLX, routing_key=queue_name, body=body,
+        properties=pika.BasicProperties(
+            content_type=properties.content_type if properties is not None else None,
+            headers=headers, delivery_mode=2
+        )
+    )
+    print(f" [DLQ] Dead-lettered message from {queue_name}: {reason}", flush=True)
+
+
+def is_transient(error: Exception) -> bool:
+    """ DB indisponibil / conexiune pierdută: mesajele se reîncearcă, nu merg în DLQ """
+    return isinstance(error, (OperationalError, DisconnectionError))
+
+
+class SensorBatcher:
+    """
+    Adună livrările de pe canal până la SENSOR_BATCH_SIZE citiri sau
+    SENSOR_FLUSH_INTERVAL_MS milisecunde, apoi le scrie și le confirmă
+    pe toate cu un singur basic_ack(multiple=True), după commit.
+    Un mesaj mutat în DLQ e confirmat imediat, individual, ca un basic_nack(multiple=True) ulterior
+    (eroare tranzitorie) să nu-l pună înapoi în coadă.
+    """
+
+    def __init__(self, channel, queue_name: str, on_flushed: Callable, batch_size: int = SENSOR_BATCH_SIZE,
+                 flush_interval_ms: int = SENSOR_FLUSH_INTERVAL_MS):
+        self.channel = channel
+        self.queue_name = queue_name
+        self.on_flushed = on_flushed
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        # (delivery tag, properties, body, citiri) pentru fiecare mesaj valid din lot
+        self.messages: List[Tuple[int, object, bytes, List[Tuple[int, int, float]]]] = []
+        self.count = 0
+        self.dead_lettered: Set[int] = set()  # delivery tag-uri deja confirmate individual
+        self.first_at = None
+
+    def add(self, method, properties, body):
+        try:
+            readings = parse_readings(properties, body)
+            self.messages.append((method.delivery_tag, properties, body, readings))
+            self.count += len(readings)
+        except Exception as e:
+            # Mesaj otrăvit: nu îl putem procesa niciodată, îl mutăm în DLQ
+            self._dead_letter(method.delivery_tag, properties, body, f"parse error: {e}")
+
+        if self.first_at is None:
+            self.first_at = time.monotonic()
+
+        if self.count >= self.batch_size:
+            self.flush()
+
+    def due(self) -> bool:
+        return self.first_at is not None and time.monotonic() - self.first_at >= self.flush_interval
+
+    def flush(self):
+        if self.first_at is None:
+            return
+
+        started = time.perf_counter()
+        readings = [reading for _, _, _, message_readings in self.messages for reading in message_readings]
+
+        db = database.SessionLocal()
+        try:
+            try:
+                folded, totals, period_totals = ingest_readings(db, readings)
+            except Exception as e:
+                db.rollback()
+                if is_transient(e):
+                    raise
+                # Eroare de date: izolăm mesajul vinovat scriind lotul mesaj cu mesaj
+                print(f"Error writing sensor batch: {e}. Retrying message by message.", flush=True)
+                folded, totals, period_totals = self._write_one_by_one(db)
+
+            # Consumul e deja salvat: o eroare la alerte nu trebuie să retrimită lotul
+            try:
+                self.on_flushed(db, folded, totals, period_totals)
+            except Exception as e:
+                db.rollback()
+                print(f"Error evaluating alerts for sensor batch: {e}", flush=True)
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            # Doar mesajele încă neconfirmate (nu și cele deja mutate în DLQ) se întorc în coadă
+            unsettled = self._unsettled_tags()
+            print(f"Error writing sensor batch: {e}. Requeueing {len(unsettled)} messages.", flush=True)
+            if unsettled:
+                self.channel.basic_nack(delivery_tag=max(unsettled), multiple=True, requeue=True)
+            self._reset()
+            time.sleep(1)
+            return
+        finally:
+            db.close()
+
+        unsettled = self._unsettled_tags()
+        if unsettled:
+            # Ack/nack multiple nu trebuie să țintească un tag deja confirmat individual
+            self.channel.basic_ack(delivery_tag=max(unsettled), multiple=True)
+
+        elapsed = time.perf_counter() - started
+        rate = len(readings) / elapsed if elapsed > 0 else 0.0
+        print(f" [BATCH] Flushed {len(readings)} readings into {len(folded)} buckets "
+              f"in {elapsed * 1000:.1f} ms ({rate:.0f} readings/s)", flush=True)
+        self._reset()
+
+    def _write_one_by_one(self, db):
+        folded: Dict[BucketKey, float] = {}
+        totals: Dict[BucketKey, float] = {}
+        period_totals: rollups.PeriodTotals = {}
+        for delivery_tag, properties, body, readings in self.messages:
+            try:
+                message_folded, message_totals, message_periods = ingest_readings(db, readings)
+            except Exception as e:
+                db.rollback()
+                if is_transient(e):
+                    raise
+                self._dead_letter(delivery_tag, properties, body, f"persist error: {e}")
+                continue
+            for key, delta in message_folded.items():
+                folded[key] = folded.get(key, 0.0) + delta
+            totals.update(message_totals)
+            for resolution, values in message_periods.items():
+                period_totals.setdefault(resolution, {}).update(values)
+        return folded, totals, period_totals
+
+    def _dead_letter(self, delivery_tag: int, properties, body: bytes, reason: str):
+        dead_letter(self.channel, self.queue_name, properties, body, reason)
+        self.channel.basic_ack(delivery_tag=delivery_tag)
+        self.dead_lettered.add(delivery_tag)
+
+    def _unsettled_tags(self) -> List[int]:
+        return [delivery_tag for delivery_tag, _, _, _ in self.messages if delivery_tag not in self.dead_lettered]
+
+    def _reset(self):
+        self.messages = []
+        self.count = 0
+        self.dead_lettered = set()
+        self.first_at = None
+
+
+def start_batched_sensor_consumer(rabbit_host: str, queue_name: str, on_flushed: Callable,
+                                  declare: Optional[Callable] = None):
+    """
+    Thread care ascultă coada de senzori în mod batch (ack manual, după commit).
+    `declare(channel)` declară topologia cozii (implicit doar coada, durable).
+    """
+    # Verificăm termenul de flush de câteva ori pe interval
+    poll_timeout = max(SENSOR_FLUSH_INTERVAL_MS / 4000.0, 0.01)
+
+    while True:
+        try:
+            print(f" [*] [SENSOR] Connecting to RabbitMQ (batch mode, size={SENSOR_BATCH_SIZE}, "
+                  f"flush={SENSOR_FLUSH_INTERVAL_MS}ms, prefetch={SENSOR_PREFETCH})...", flush=True)
+            connection = pika.BlockingConnection(
+                pika.ConnectionParameters(host=rabbit_host, heartbeat=600, blocked_connection_timeout=300)
+            )
+            channel = connection.channel()
+            # Publicarea în DLQ e confirmată de broker înainte să confirmăm mesajul original
+            channel.confirm_delivery()
+            if declare:
+                declare(channel)
+            else:
+                channel.queue_declare(queue=queue_name, durable=True)
+            declare_dead_letter_topology(channel)
+            channel.basic_qos(prefetch_count=SENSOR_PREFETCH)
+
+            batcher = SensorBatcher(channel, queue_name, on_flushed)
+            print(f' [*] [SENSOR] Connected! Waiting for measurements on {queue_name}.', flush=True)
+
+            for method, properties, body in channel.consume(queue_name, inactivity_timeout=poll_timeout):
+                if method is not None:
+                    batcher.add(method, properties, body)
+                if batcher.due():
+                    batcher.flush()
+        except Exception as e:
+            # Mesajele neconfirmate se relivrează; cele deja salvate sunt ignorate la dedup
+            print(f" [!] [SENSOR] Connection lost: {e}. Retrying in 5s...", flush=True)
+            time.sleep(5)
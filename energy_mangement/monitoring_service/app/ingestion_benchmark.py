@@ -0,0 +1,64 @@
+"""
+Benchmark ingestie: aceleași citiri scrise prin ingest_readings în loturi de SENSOR_BATCH_SIZE
+(un commit per lot, ca SensorBatcher) față de un mesaj per commit (consumatorul vechi).
+
+    python -m app.ingestion_benchmark [--readings 20000] [--single 2000] [--batch 500]
+
+Folosește DATABASE_URL dacă e setat; altfel o bază SQLite temporară (tabelele se creează automat).
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from typing import List, Tuple
+
+
+def _readings(count: int, devices: int) -> List[Tuple[int, int, float]]:
+    # Timestamp-uri noi la fiecare rulare: dedup-ul nu trebuie să sară citiri
+    base = int(time.time() * 1000)
+    return [(random.randint(1, devices), base + i, random.uniform(0.5, 2.5)) for i in range(count)]
+
+
+def _run(db, chunks: List[list]) -> float:
+    from .ingestion import ingest_readings
+
+    written = 0
+    started = time.perf_counter()
+    for chunk in chunks:
+        ingest_readings(db, chunk)
+        written += len(chunk)
+    return written / (time.perf_counter() - started)
+
+
+def benchmark(readings: int, single: int, batch_size: int, devices: int):
+    from . import database, models
+
+    models.Base.metadata.create_all(bind=database.engine)
+    print(f" [BENCH] db={database.engine.dialect.name}, {devices} devices", flush=True)
+    db = database.SessionLocal()
+    try:
+        data = _readings(readings, devices)
+        batched = _run(db, [data[start:start + batch_size] for start in range(0, len(data), batch_size)])
+        print(f" [BENCH] batched ({batch_size}/commit, {readings} readings): {batched:10,.0f} readings/s", flush=True)
+
+        data = _readings(single, devices)
+        one_by_one = _run(db, [[reading] for reading in data])
+        print(f" [BENCH] one message per commit ({single} readings): {one_by_one:10,.0f} readings/s", flush=True)
+        print(f" [BENCH] speedup: {batched / one_by_one:.1f}x", flush=True)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ingest_readings throughput: batched vs one message per commit")
+    parser.add_argument("--readings", type=int, default=20000, help="citiri pentru varianta în loturi")
+    parser.add_argument("--single", type=int, default=2000, help="citiri pentru varianta un mesaj per commit")
+    parser.add_argument("--batch", type=int, default=int(os.getenv("SENSOR_BATCH_SIZE", "500")))
+    parser.add_argument("--devices", type=int, default=1000)
+    args = parser.parse_args()
+
+    # database.py citește DATABASE_URL la import, deci trebuie setat înainte de primul import din app
+    if not os.getenv("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/ingestion_benchmark.db"
+    benchmark(args.readings, args.single, args.batch, args.devices)
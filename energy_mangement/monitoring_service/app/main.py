@@ -1,15 +1,16 @@
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import pika
 import json
 import threading
-from datetime import datetime
 import os
 import time
-from typing import List
+from typing import List, Optional
 from . import schemas
-from . import models, database
+from . import models, database, crud, partitions, rollups, sensors, sharding
+from .device_cache import device_limits
+from .alerts import alert_tracker
 
 # Așteptăm puțin să pornească RabbitMQ (retry mechanism e mai jos, dar asta ajută la startul inițial)
 time.sleep(10)
@@ -23,194 +24,96 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Creăm tabelele (include acum și MonitoredDevice dacă ai actualizat models.py)
 models.Base.metadata.create_all(bind=database.engine)
+# PostgreSQL: hourly_consumption partiționată pe lună (migrare o singură dată pentru bazele vechi)
+partitions.migrate(database.engine)
+partitions.ensure_partitions(database.engine)
+crud.ensure_bucket_unique_index(database.engine)
 
-# Config RabbitMQ
-RABBIT_HOST = os.getenv("RABBIT_HOST", "rabbitmq")
-QUEUE_SENSOR_DATA = "sensor_data"
+# Config RabbitMQ (consumatorul de senzori și publisher-ul sunt în sensors.py)
+RABBIT_HOST = sensors.RABBIT_HOST
 QUEUE_DEVICE_SYNC = "device_sync_queue"
-QUEUE_NOTIFICATIONS = "notification_queue"
-
-# ==================================================================================
-# 1. CONSUMER PENTRU SENZORI (Calcul consum orar)
-# ==================================================================================
-def send_notification(user_id: int, message: str, device_id: int):
-    try:
-        connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBIT_HOST))
-        channel = connection.channel()
-        channel.queue_declare(queue=QUEUE_NOTIFICATIONS, durable=True)
-
-        payload = {
-            "user_id": user_id,
-            "message": message,
-            "device_id": device_id
-        }
-
-        channel.basic_publish(
-            exchange='',
-            routing_key=QUEUE_NOTIFICATIONS,
-            body=json.dumps(payload)
-        )
-        connection.close()
-        print(f" [ALERT] Sent notification for User {user_id}", flush=True)
-    except Exception as e:
-        print(f"Error sending notification: {e}", flush=True)
-
-
-def process_sensor_message(ch, method, properties, body):
-    """ Procesează datele de consum cu DEBUG LOGGING """
-    db = database.SessionLocal()
-    try:
-        data = json.loads(body)
-        device_id = data.get('device_id')
-        measurement = data.get('measurement_value')
-
-        print(f" [SENSOR] Received: Device {device_id}, Value {measurement}", flush=True)
-
-        # 1. Calculăm timestamp-ul rotunjit (logica ta existentă)
-        timestamp_ms = data['timestamp']
-        dt_object = datetime.fromtimestamp(timestamp_ms / 1000.0)
-        minute = dt_object.minute
-        rounded_minute = (minute // 10) * 10
-        interval_start = dt_object.replace(minute=rounded_minute, second=0, microsecond=0)
-        interval_timestamp = int(interval_start.timestamp() * 1000)
-
-        # 2. Salvăm/Actualizăm consumul
-        record = db.query(models.HourlyConsumption).filter(
-            models.HourlyConsumption.device_id == device_id,
-            models.HourlyConsumption.timestamp == interval_timestamp
-        ).first()
-
-        if record:
-            record.total_consumption += measurement
-        else:
-            record = models.HourlyConsumption(
-                device_id=device_id,
-                timestamp=interval_timestamp,
-                total_consumption=measurement
-            )
-            db.add(record)
-
-        db.commit()
-        # Facem refresh ca să fim siguri că avem valoarea actualizată din DB
-        db.refresh(record)
-        print(f" [DB] Total Consumption for Device {device_id} is now: {record.total_consumption}", flush=True)
-
-        # =================================================================
-        # 3. VERIFICAREA PENTRU ALERTĂ (DEBUGGING)
-        # =================================================================
-
-        # Căutăm setările device-ului
-        device_settings = db.query(models.MonitoredDevice).filter(
-            models.MonitoredDevice.device_id == device_id
-        ).first()
-
-        if not device_settings:
-            print(f" [DEBUG] ❌ Device {device_id} NOT FOUND in 'monitored_devices' table!", flush=True)
-            print(" [DEBUG] Hint: Did you sync the device or insert it manually?", flush=True)
-
-        else:
-            current_total = record.total_consumption
-            max_limit = device_settings.max_hourly_consumption
-
-            print(f" [DEBUG] 🔍 Checking Limit: Current ({current_total}) > Max ({max_limit})?", flush=True)
-
-            if max_limit > 0 and current_total > max_limit:
-                print(" [DEBUG] 🚨 LIMIT EXCEEDED! Sending alert...", flush=True)
-
-                msg = f"Alert! Device {device_id} exceeded limit! Current: {current_total:.2f}, Max: {max_limit}"
-                send_notification(device_settings.user_id, msg, device_id)
-            else:
-                print(" [DEBUG] ✅ Limit OK (or limit is 0). No alert sent.", flush=True)
-
-    except Exception as e:
-        print(f"Error processing sensor message: {e}", flush=True)
-    finally:
-        db.close()
-
-
-def start_sensor_consumer():
-    """ Thread care ascultă coada 'sensor_data' """
-    while True:
-        try:
-            print(f" [*] [SENSOR] Connecting to RabbitMQ...", flush=True)
-            connection = pika.BlockingConnection(
-                pika.ConnectionParameters(host=RABBIT_HOST, heartbeat=600, blocked_connection_timeout=300)
-            )
-            channel = connection.channel()
-            channel.queue_declare(queue=QUEUE_SENSOR_DATA, durable=True)
-            channel.basic_consume(queue=QUEUE_SENSOR_DATA, on_message_callback=process_sensor_message, auto_ack=True)
-            print(' [*] [SENSOR] Connected! Waiting for measurements.', flush=True)
-            channel.start_consuming()
-        except Exception as e:
-            print(f" [!] [SENSOR] Connection lost: {e}. Retrying in 5s...", flush=True)
-            time.sleep(5)
+publisher = sensors.publisher
 
+# Paginare pentru API-ul de istoric
+CONSUMPTION_PAGE_DEFAULT = int(os.getenv("CONSUMPTION_PAGE_DEFAULT", "500"))
+CONSUMPTION_PAGE_MAX = int(os.getenv("CONSUMPTION_PAGE_MAX", "5000"))
+# Rezoluția nativă depinde de BUCKET_WIDTH_MINUTES (ex: 10m, 15m, 60m)
+RESOLUTION_PATTERN = "^(" + "|".join(crud.RESOLUTION_SOURCES) + ")$"
 
 # ==================================================================================
-# 2. CONSUMER PENTRU SINCRONIZARE (Update Device List) - CERINȚA A2/A3
+# 1. CONSUMER PENTRU SINCRONIZARE (Update Device List) - CERINȚA A2/A3
 # ==================================================================================
 
 def process_sync_message(ch, method, properties, body):
-    """ Procesează evenimente de sincronizare (CREATE/UPDATE/DELETE Device) """
+    """ Procesează evenimente de sincronizare (CREATE/UPDATE/DELETE Device), individuale sau în lot """
     try:
         data = json.loads(body)
-        operation = data.get("operation")
-        device_id = data.get("device_id")
-
-        print(f" [SYNC] Received {operation} for device {device_id}", flush=True)
+        events = sharding.sync_events(data)
+
+        # Fiecare eveniment poartă starea completă a device-ului, deci în lot contează doar ultimul
+        upserts, deletes = {}, set()
+        for event in events:
+            device_id = event.get("device_id")
+            if event.get("operation") in ["CREATE", "UPDATE"]:
+                deletes.discard(device_id)
+                upserts[device_id] = {
+                    "user_id": event.get("user_id"),
+                    "max_hourly_consumption": event.get("max_hourly_consumption"),
+                }
+            elif event.get("operation") == "DELETE":
+                upserts.pop(device_id, None)
+                deletes.add(device_id)
+
+        if len(events) == 1:
+            print(f" [SYNC] Received {events[0].get('operation')} for device {events[0].get('device_id')}", flush=True)
+        else:
+            print(f" [SYNC] Received batch of {len(events)} events "
+                  f"({len(upserts)} upserts, {len(deletes)} deletes)", flush=True)
 
         db = database.SessionLocal()
         try:
-            # Folosim modelul MonitoredDevice adăugat în models.py
-            if operation in ["CREATE", "UPDATE"]:
-                existing = db.query(models.MonitoredDevice).filter(
-                    models.MonitoredDevice.device_id == device_id).first()
-
-                if existing:
-                    existing.user_id = data.get("user_id")
-                    existing.max_hourly_consumption = data.get("max_hourly_consumption")
-                    print(f" [SYNC] Updated Device {device_id}")
-                else:
-                    new_dev = models.MonitoredDevice(
-                        device_id=device_id,
-                        user_id=data.get("user_id"),
-                        max_hourly_consumption=data.get("max_hourly_consumption")
-                    )
-                    db.add(new_dev)
-                    print(f" [SYNC] Created Device {device_id}")
-
-                db.commit()
-
-            elif operation == "DELETE":
-                db.query(models.MonitoredDevice).filter(models.MonitoredDevice.device_id == device_id).delete()
-                db.commit()
-                print(f" [SYNC] Deleted Device {device_id}")
-
+            # Un singur UPSERT + un singur DELETE pentru tot lotul
+            crud.apply_device_sync(db, upserts, deletes)
+            db.commit()
         except Exception as e:
-            print(f"Error Sync DB: {e}", flush=True)
+            # Evenimentele de sync sunt idempotente: le reîncercăm în loc să le pierdem
+            db.rollback()
+            print(f"Error Sync DB: {e}. Requeueing.", flush=True)
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            time.sleep(1)
+            return
         finally:
             db.close()
 
+        sharding.apply_sync_to_cache(data)
+
     except Exception as e:
         print(f"Error processing sync message: {e}", flush=True)
 
+    # Ack manual, abia după commit
+    ch.basic_ack(delivery_tag=method.delivery_tag)
+
 
 def start_sync_consumer():
     """ Thread care ascultă coada 'device_sync_queue' """
     while True:
         try:
-            print(f" [*] [SYNC] Connecting to RabbitMQ...", flush=True)
+            print(" [*] [SYNC] Connecting to RabbitMQ...", flush=True)
             connection = pika.BlockingConnection(
                 pika.ConnectionParameters(host=RABBIT_HOST, heartbeat=600, blocked_connection_timeout=300)
             )
             channel = connection.channel()
             # Declarăm coada ca durable=True ca să nu pierdem mesaje dacă monitoring e jos
             channel.queue_declare(queue=QUEUE_DEVICE_SYNC, durable=True)
-            channel.basic_consume(queue=QUEUE_DEVICE_SYNC, on_message_callback=process_sync_message, auto_ack=True)
+            channel.exchange_declare(exchange=sharding.EXCHANGE_DEVICE_SYNC, exchange_type="fanout", durable=True)
+            channel.queue_bind(queue=QUEUE_DEVICE_SYNC, exchange=sharding.EXCHANGE_DEVICE_SYNC)
+            channel.basic_qos(prefetch_count=100)
+            channel.basic_consume(queue=QUEUE_DEVICE_SYNC, on_message_callback=process_sync_message)
             print(' [*] [SYNC] Connected! Waiting for sync events.', flush=True)
             channel.start_consuming()
         except Exception as e:
@@ -219,23 +122,78 @@ def start_sync_consumer():
 
 
 # ==================================================================================
-# 3. STARTUP & ENDPOINTS
+# 2. STARTUP & ENDPOINTS
 # ==================================================================================
 
 @app.on_event("startup")
 def startup_event():
-    # Pornim Thread-ul 1: Senzori (Date Simulator)
-    t1 = threading.Thread(target=start_sensor_consumer, daemon=True)
-    t1.start()
+    # Încărcăm limitele device-urilor o singură dată, înainte de a porni consumatorii
+    db = database.SessionLocal()
+    try:
+        device_limits.load_all(db)
+        alert_tracker.load(db)
+        rollups.backfill_if_empty(db)
+    finally:
+        db.close()
+
+    publisher.start()
+
+    # Pornim Thread-ul 1: Senzori (Date Simulator) din coada veche, nepartiționată
+    # (cu sharding, doar pe replica ce deține shard-ul 0; vezi sharding.drains_legacy_queue)
+    if sharding.drains_legacy_queue():
+        t1 = threading.Thread(target=sensors.start_sensor_consumer, daemon=True)
+        t1.start()
 
     # Pornim Thread-ul 2: Sincronizare (Date Device Service)
     t2 = threading.Thread(target=start_sync_consumer, daemon=True)
     t2.start()
 
-
-@app.get("/consumption/{device_id}", response_model=List[schemas.ConsumptionRecord])
-def get_device_consumption(device_id: int, db: Session = Depends(database.get_db)):
-    records = db.query(models.HourlyConsumption).filter(
-        models.HourlyConsumption.device_id == device_id
-    ).order_by(models.HourlyConsumption.timestamp).all()
-    return records
\ No newline at end of file
+    # Thread-ul 3: cache-ul local de limite, ținut la zi și când sync-ul e consumat de altă replică
+    t3 = threading.Thread(target=sharding.start_cache_listener, daemon=True)
+    t3.start()
+
+    # Procesele worker pentru shard-urile deținute (doar dacă SENSOR_SHARDS > 0)
+    sharding.start_shard_workers()
+
+    # Partiții în avans + retenția bucket-urilor brute (o singură replică rulează efectiv job-ul)
+    partitions.start_maintenance_scheduler()
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    publisher.close()
+
+
+@app.get("/consumption/{device_id}", response_model=List[schemas.ConsumptionBucket])
+async def get_device_consumption(
+        device_id: int,
+        response: Response,
+        from_ts: Optional[int] = Query(None, alias="from", description="Început fereastră (ms, inclusiv)"),
+        to_ts: Optional[int] = Query(None, alias="to", description="Sfârșit fereastră (ms, exclusiv)"),
+        resolution: str = Query(crud.NATIVE_RESOLUTION, pattern=RESOLUTION_PATTERN),
+        limit: int = Query(CONSUMPTION_PAGE_DEFAULT, ge=1, le=CONSUMPTION_PAGE_MAX),
+        cursor: Optional[int] = Query(None, description="Valoarea X-Next-Cursor din pagina anterioară"),
+        order: str = Query("asc", pattern="^(asc|desc)$"),
+        db: AsyncSession = Depends(database.get_async_db)
+):
+    """
+    Istoricul agregat al unui device. Dimensiunea răspunsului depinde de fereastra și rezoluția
+    cerute, nu de vechimea device-ului. Dacă mai sunt date, header-ul X-Next-Cursor
+    conține cursorul pentru pagina următoare.
+    """
+    records = await crud.query_consumption(db, device_id, resolution, from_ts, to_ts, cursor, limit + 1,
+                                           descending=order == "desc")
+    if len(records) > limit:
+        records = records[:limit]
+        response.headers["X-Next-Cursor"] = str(records[-1]["timestamp"])
+    return records
+
+
+@app.get("/metrics")
+def get_metrics():
+    """ Contoare interne (ex: hit/miss pentru cache-ul de limite) """
+    return {
+        "device_cache": device_limits.stats(),
+        "alerts": alert_tracker.stats(),
+        "publisher": publisher.stats(),
+    }
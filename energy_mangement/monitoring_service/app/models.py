@@ -1,18 +1,69 @@
-from sqlalchemy import Column, Integer, Float, BigInteger
+from sqlalchemy import Column, Integer, Float, BigInteger, Index
 from .database import Base
 
 class HourlyConsumption(Base):
     __tablename__ = "hourly_consumption"
 
-    id = Column(Integer, primary_key=True, index=True)
-    device_id = Column(Integer, nullable=False, index=True)
-    timestamp = Column(BigInteger, nullable=False) # Timestamp-ul orei (ex: 10:00, 11:00)
+    # Cheia primară (device_id, timestamp) e și cheia unică a bucket-ului (UPSERT atomic cu ON CONFLICT).
+    # Include timestamp-ul, cum cere PostgreSQL pentru tabelele partiționate (vezi partitions.py).
+    device_id = Column(Integer, primary_key=True)
+    timestamp = Column(BigInteger, primary_key=True)  # începutul bucket-ului (ms, UTC)
     total_consumption = Column(Float, default=0.0)
 
+    # Partiții lunare în PostgreSQL; ignorat de celelalte dialecte
+    __table_args__ = {"postgresql_partition_by": 'RANGE ("timestamp")'}
+
+class RollupMixin:
+    """ Totaluri precalculate pe o perioadă (oră/zi/lună), ținute la zi de consumatorul de senzori """
+    device_id = Column(Integer, primary_key=True)
+    timestamp = Column(BigInteger, primary_key=True)  # începutul perioadei (ms, UTC)
+    total_consumption = Column(Float, nullable=False, default=0.0)
+
+
+class HourlyRollup(RollupMixin, Base):
+    __tablename__ = "consumption_hourly"
+
+
+class DailyRollup(RollupMixin, Base):
+    __tablename__ = "consumption_daily"
+
+
+class MonthlyRollup(RollupMixin, Base):
+    __tablename__ = "consumption_monthly"
+
+
+class ProcessedReading(Base):
+    """
+    Id-ul fiecărei citiri deja numărate (device_id + timestamp-ul citirii + hash-ul citirii).
+    O relivrare (după crash, nack sau replay din DLQ) nu mai adună consumul a doua oară, dar două
+    citiri diferite ale aceluiași device în aceeași milisecundă sunt numărate amândouă.
+    """
+    __tablename__ = "processed_readings"
+
+    device_id = Column(Integer, primary_key=True)
+    timestamp = Column(BigInteger, primary_key=True)  # ms, timestamp-ul citirii (nu al bucket-ului)
+    reading_hash = Column(BigInteger, primary_key=True)  # ingestion.reading_hash: 64 biți din (device, ts, valoare)
+
+    # Pentru curățarea periodică a id-urilor vechi (partitions.run_retention)
+    __table_args__ = (
+        Index("ix_processed_readings_timestamp", "timestamp"),
+    )
+
+
 class MonitoredDevice(Base):
     __tablename__ = "monitored_devices"
 
     device_id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, nullable=False)
     # În A2 nu e obligatoriu max_consumption, dar îl putem pune opțional
-    max_hourly_consumption = Column(Float, nullable=True)
\ No newline at end of file
+    max_hourly_consumption = Column(Float, nullable=True)
+
+
+class AlertState(Base):
+    """ Ultima alertă trimisă pentru fiecare device (supraviețuiește restartului) """
+    __tablename__ = "alert_state"
+
+    device_id = Column(Integer, primary_key=True)
+    interval_timestamp = Column(BigInteger, nullable=False)  # intervalul de 10 minute al alertei
+    tier = Column(Integer, nullable=False, default=1)  # cel mai mare prag anunțat în interval
+    last_sent_at = Column(BigInteger, nullable=False)  # ms, pentru cooldown
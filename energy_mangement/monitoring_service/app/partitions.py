@@ -0,0 +1,283 @@
+"""
+Stocarea bucket-urilor brute (hourly_consumption) pe termen lung.
+
+- PostgreSQL: tabela e partiționată pe lună după `timestamp` (RANGE). Partițiile se creează
+  din timp (PARTITION_MONTHS_AHEAD) și, la nevoie, la scriere. Interogările de istoric filtrează
+  pe timestamp, deci ating doar partițiile din fereastra cerută (partition pruning).
+- Retenție: lunile mai vechi de RAW_RETENTION_DAYS rămân doar în rollup-uri (orar/zilnic/lunar).
+  Înainte de ștergere verificăm, pe fiecare oră, că rollup-ul acoperă bucket-urile brute (altfel
+  adăugăm diferența în rollup-uri, fără să pierdem citirile întârziate scrise doar acolo),
+  apoi partiția lunii e ștearsă cu DROP TABLE (fără DELETE pe milioane de rânduri).
+
+Job-ul de mentenanță rulează în proces, la MAINTENANCE_INTERVAL_SECONDS; cu mai multe replici,
+un advisory lock în PostgreSQL garantează că rulează o singură dată. Manual:
+
+    python -m app.partitions maintain
+"""
+import argparse
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import and_, func, inspect, select, text
+from sqlalchemy.orm import Session
+
+from . import database, models, rollups
+from .crud import BucketKey
+from .rollups import DAY_MS, HOUR_MS, MAINTENANCE_LOCK_ID, month_start
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+# 0 = bucket-urile brute se păstrează pentru totdeauna
+RAW_RETENTION_DAYS = int(os.getenv("RAW_RETENTION_DAYS", "90"))
+# Id-urile citirilor (dedup) contează doar cât timp mai pot apărea relivrări / replay din DLQ
+PROCESSED_READINGS_RETENTION_DAYS = int(os.getenv("PROCESSED_READINGS_RETENTION_DAYS", "7"))
+MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "3600"))
+
+TABLE = models.HourlyConsumption.__tablename__
+
+_known_months: Set[int] = set()  # lunile pentru care partiția sigur există (cache per proces)
+_partitioned: Optional[bool] = None
+_lock = threading.Lock()
+
+
+def add_months(timestamp_ms: int, months: int) -> int:
+    dt = datetime.fromtimestamp(month_start(timestamp_ms) / 1000.0, tz=timezone.utc)
+    index = dt.year * 12 + dt.month - 1 + months
+    return int(datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def partition_name(month_ms: int) -> str:
+    dt = datetime.fromtimestamp(month_ms / 1000.0, tz=timezone.utc)
+    return f"{TABLE}_p{dt.year:04d}{dt.month:02d}"
+
+
+def partition_month(name: str) -> int:
+    suffix = name[len(TABLE) + 2:]
+    return int(datetime(int(suffix[:4]), int(suffix[4:6]), 1, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def is_partitioned(engine) -> bool:
+    global _partitioned
+    if _partitioned is None:
+        if engine.dialect.name != "postgresql":
+            _partitioned = False
+        else:
+            with engine.connect() as conn:
+                _partitioned = conn.execute(text(
+                    "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+                    "WHERE c.relname = :name"
+                ), {"name": TABLE}).first() is not None
+    return _partitioned
+
+
+def _create_partition(conn, month_ms: int):
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month_ms)} PARTITION OF {TABLE} "
+        f"FOR VALUES FROM ({month_ms}) TO ({add_months(month_ms, 1)})"
+    ))
+
+
+def migrate(engine):
+    """
+    Baze vechi: hourly_consumption e o tabelă obișnuită (cu `id`). O înlocuim, o singură dată,
+    cu tabela partiționată: partiții pentru toată plaja de date, apoi copiem rândurile
+    (comasând eventualele duplicate) și ștergem tabela veche. Totul într-o tranzacție.
+    """
+    global _partitioned
+    if engine.dialect.name != "postgresql" or is_partitioned(engine):
+        return
+
+    old = f"{TABLE}_unpartitioned"
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MAINTENANCE_LOCK_ID})
+        # Altă replică a terminat migrarea cât am așteptat lock-ul
+        if conn.execute(text(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :name"
+        ), {"name": TABLE}).first() is not None:
+            _partitioned = True
+            return
+
+        print(f" [DB] Migrating {TABLE} to monthly partitions...", flush=True)
+        pk = inspect(conn).get_pk_constraint(TABLE).get("name")
+        conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO {old}"))
+        if pk:
+            # Numele constrângerii rămâne ocupat după rename; noua tabelă îl folosește pentru PK
+            conn.execute(text(f'ALTER TABLE {old} DROP CONSTRAINT "{pk}"'))
+        models.HourlyConsumption.__table__.create(bind=conn)
+
+        first, last = conn.execute(text(f'SELECT MIN("timestamp"), MAX("timestamp") FROM {old}')).first()
+        now_ms = int(time.time() * 1000)
+        month = month_start(first if first is not None else now_ms)
+        end = max(add_months(now_ms, PARTITION_MONTHS_AHEAD), month_start(last if last is not None else now_ms))
+        while month <= end:
+            _create_partition(conn, month)
+            month = add_months(month, 1)
+
+        conn.execute(text(
+            f'INSERT INTO {TABLE} (device_id, "timestamp", total_consumption) '
+            f'SELECT device_id, "timestamp", SUM(total_consumption) FROM {old} GROUP BY device_id, "timestamp"'
+        ))
+        conn.execute(text(f"DROP TABLE {old}"))
+
+    _partitioned = True
+    print(f" [DB] {TABLE} is now partitioned by month.", flush=True)
+
+
+def ensure_partitions(engine, months_ahead: int = PARTITION_MONTHS_AHEAD):
+    """ Partițiile pentru luna curentă și următoarele `months_ahead` luni """
+    if not is_partitioned(engine):
+        return
+    month = month_start(int(time.time() * 1000))
+    with engine.begin() as conn:
+        for _ in range(months_ahead + 1):
+            _create_partition(conn, month)
+            _known_months.add(month)
+            month = add_months(month, 1)
+
+
+def ensure_months(db: Session, timestamps: Iterable[int]):
+    """ Apelat înainte de scriere: creează partițiile lipsă (ex: replay mai vechi de prima partiție) """
+    engine = db.get_bind()
+    if not is_partitioned(engine):
+        return
+    months = {month_start(day * DAY_MS) for day in {ts // DAY_MS for ts in timestamps}} - _known_months
+    if not months:
+        return
+    # Conexiune separată (commit imediat): DDL-ul nu trebuie anulat odată cu lotul
+    with _lock, engine.begin() as conn:
+        for month in sorted(months):
+            _create_partition(conn, month)
+    _known_months.update(months)
+
+
+def raw_horizon(now_ms: Optional[int] = None) -> Optional[int]:
+    """ Bucket-urile brute dinaintea acestei luni se păstrează doar în rollup-uri (None = fără retenție) """
+    if RAW_RETENTION_DAYS <= 0:
+        return None
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    return month_start(now_ms - RAW_RETENTION_DAYS * DAY_MS)
+
+
+def expired_months(db: Session, horizon: int) -> List[int]:
+    if is_partitioned(db.get_bind()):
+        names = db.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :name"
+        ), {"name": TABLE}).scalars()
+        return sorted(m for m in (partition_month(name) for name in names) if m < horizon)
+
+    oldest = db.query(func.min(models.HourlyConsumption.timestamp)).scalar()
+    months = []
+    month = month_start(oldest) if oldest is not None else horizon
+    while month < horizon:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def _missing_from_rollups(db: Session, start: int, end: int) -> Dict[BucketKey, float]:
+    """ Per (device_id, oră) din [start, end): cât au bucket-urile brute în plus față de rollup-ul orar """
+    raw, hourly = models.HourlyConsumption, models.HourlyRollup
+    hour = (raw.timestamp // HOUR_MS) * HOUR_MS
+    raw_hours = select(
+        raw.device_id.label("device_id"), hour.label("timestamp"),
+        func.sum(raw.total_consumption).label("total_consumption"),
+    ).where(raw.timestamp >= start, raw.timestamp < end).group_by(raw.device_id, hour).subquery()
+    rows = db.execute(select(
+        raw_hours.c.device_id, raw_hours.c.timestamp,
+        raw_hours.c.total_consumption - func.coalesce(hourly.total_consumption, 0.0),
+    ).select_from(raw_hours.outerjoin(hourly, and_(
+        hourly.device_id == raw_hours.c.device_id, hourly.timestamp == raw_hours.c.timestamp
+    ))))
+    return {
+        (device_id, timestamp): missing for device_id, timestamp, missing in rows
+        if missing > 1e-6 * max(1.0, abs(missing))
+    }
+
+
+def downsample_month(db: Session, month_ms: int):
+    """ Păstrează luna doar ca rollup-uri orare (+zilnice/lunare) și șterge bucket-urile ei brute """
+    end = add_months(month_ms, 1)
+    # Rollup-ul poate conține în plus citiri întârziate scrise doar acolo (mai vechi decât retenția),
+    # deci nu îl reconstruim din brute: adăugăm doar ce lipsește, pe fiecare oră
+    missing = _missing_from_rollups(db, month_ms, end)
+    if missing:
+        print(f" [RETENTION] Rollups are missing raw data for {partition_name(month_ms)} "
+              f"({len(missing)} device-hours, {sum(missing.values()):.3f} total), merging...", flush=True)
+        rollups.apply(db, missing)
+
+    if is_partitioned(db.get_bind()):
+        db.execute(text(f"DROP TABLE IF EXISTS {partition_name(month_ms)}"))
+        _known_months.discard(month_ms)
+    else:
+        db.query(models.HourlyConsumption).filter(
+            models.HourlyConsumption.timestamp < end
+        ).delete(synchronize_session=False)
+    db.commit()
+    print(f" [RETENTION] Downsampled and dropped raw buckets for {partition_name(month_ms)}", flush=True)
+
+
+def run_retention(db: Session):
+    horizon = raw_horizon()
+    if horizon is not None:
+        for month in expired_months(db, horizon):
+            downsample_month(db, month)
+
+    if PROCESSED_READINGS_RETENTION_DAYS > 0:
+        cutoff = int(time.time() * 1000) - PROCESSED_READINGS_RETENTION_DAYS * DAY_MS
+        deleted = db.query(models.ProcessedReading).filter(
+            models.ProcessedReading.timestamp < cutoff
+        ).delete(synchronize_session=False)
+        db.commit()
+        if deleted:
+            print(f" [RETENTION] Pruned {deleted} processed reading ids", flush=True)
+
+
+def run_maintenance():
+    """ O trecere completă: partiții în avans + retenție. Sărită dacă altă replică o rulează deja. """
+    engine = database.engine
+    with engine.connect() as lock_conn:
+        if engine.dialect.name == "postgresql":
+            if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": MAINTENANCE_LOCK_ID}).scalar():
+                print(" [MAINTENANCE] Another replica is running maintenance, skipping.", flush=True)
+                return
+        db = database.SessionLocal()
+        try:
+            ensure_partitions(engine)
+            run_retention(db)
+        finally:
+            db.close()
+            if engine.dialect.name == "postgresql":
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MAINTENANCE_LOCK_ID})
+
+
+def start_maintenance_scheduler():
+    """ Thread care rulează mentenanța periodic """
+    def loop():
+        while True:
+            try:
+                run_maintenance()
+            except Exception as e:
+                print(f" [!] [MAINTENANCE] Failed: {e}", flush=True)
+            time.sleep(MAINTENANCE_INTERVAL_SECONDS)
+
+    threading.Thread(target=loop, name="maintenance", daemon=True).start()
+    print(f" [*] [MAINTENANCE] Scheduled every {MAINTENANCE_INTERVAL_SECONDS}s "
+          f"(raw retention: {RAW_RETENTION_DAYS or 'off'} days)", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition maintenance and raw bucket retention")
+    parser.add_argument("command", choices=["maintain"])
+    parser.parse_args()
+
+    models.Base.metadata.create_all(bind=database.engine)
+    migrate(database.engine)
+    run_maintenance()
+    print(" [MAINTENANCE] Done.", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Rollup-uri orare / zilnice / lunare pentru consumul din hourly_consumption (bucket-uri de BUCKET_WIDTH_MINUTES).
+
+Consumatorul de senzori le ține la zi incremental (apply), în aceeași tranzacție cu bucket-urile.
+Pentru date vechi sau după o corecție, se reconstruiesc în bloc:
+
+    python -m app.rollups rebuild [--device ID] [--since MS]
+"""
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.orm import Session
+
+from . import crud, database, models
+from .crud import BucketKey
+
+HOUR_MS = 60 * 60 * 1000
+DAY_MS = 24 * HOUR_MS
+
+# Cheia advisory lock-ului pentru mentenanță / migrare / backfill (arbitrară, unică în monitoring_db);
+# folosită și de partitions.py
+MAINTENANCE_LOCK_ID = 40714001
+
+
+def month_start(timestamp_ms: int) -> int:
+    """ Începutul lunii (UTC) în care cade timestamp-ul """
+    dt = datetime.fromtimestamp(timestamp_ms / 1000.0, tz=timezone.utc)
+    start = dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return int(start.timestamp() * 1000)
+
+
+# tabela de rollup -> funcția care dă începutul perioadei
+ROLLUPS = [
+    (models.HourlyRollup, lambda ts: ts - ts % HOUR_MS),
+    (models.DailyRollup, lambda ts: ts - ts % DAY_MS),
+    (models.MonthlyRollup, month_start),
+]
+# tabela de rollup -> rezoluția din API-ul de istoric (și cheia din update-urile live)
+ROLLUP_RESOLUTIONS = {models.HourlyRollup: "1h", models.DailyRollup: "1d", models.MonthlyRollup: "1mo"}
+
+PeriodTotals = Dict[str, Dict[BucketKey, float]]  # rezoluție -> (device_id, început perioadă) -> total
+
+
+def apply(db: Session, folded: Dict[BucketKey, float], returning: bool = False) -> PeriodTotals:
+    """
+    Adaugă delta-urile din lot în rollup-uri (un UPSERT per tabelă; nu face commit).
+    Cu `returning`, întoarce totalurile noi ale perioadelor atinse, per rezoluție.
+    """
+    totals: PeriodTotals = {}
+    for model, period_start in ROLLUPS:
+        periods: Dict[BucketKey, float] = {}
+        for (device_id, timestamp), delta in folded.items():
+            key = (device_id, period_start(timestamp))
+            periods[key] = periods.get(key, 0.0) + delta
+        totals[ROLLUP_RESOLUTIONS[model]] = crud.upsert_increment(db, model.__table__, periods, returning=returning)
+    return totals
+
+
+def rebuild(db: Session, device_id: Optional[int] = None, since: Optional[int] = None,
+            until: Optional[int] = None):
+    """
+    Recalculează rollup-urile din bucket-urile brute, în bloc (INSERT ... SELECT ... GROUP BY),
+    pe perioadele [since, until). `since`/`until` se rotunjesc la începutul lunii, ca nicio
+    perioadă să nu rămână parțială. Nu coboară sub cel mai vechi bucket brut rămas: lunile
+    mai vechi au fost deja comprimate de retenție și există doar în rollup-uri.
+    """
+    raw = models.HourlyConsumption
+    oldest_query = db.query(func.min(raw.timestamp))
+    if device_id is not None:
+        oldest_query = oldest_query.filter(raw.device_id == device_id)
+    oldest = oldest_query.scalar()
+    if oldest is None:
+        return
+
+    since = month_start(max(since or 0, oldest))
+    if until is not None:
+        until = month_start(until)
+        if until <= since:
+            return
+
+    def scoped(query, model):
+        if device_id is not None:
+            query = query.filter(model.device_id == device_id)
+        query = query.filter(model.timestamp >= since)
+        if until is not None:
+            query = query.filter(model.timestamp < until)
+        return query
+
+    for model, _ in ROLLUPS:
+        scoped(db.query(model), model).delete(synchronize_session=False)
+
+    # Orar și zilnic: agregare direct în SQL din bucket-urile brute
+    for model, width in ((models.HourlyRollup, HOUR_MS), (models.DailyRollup, DAY_MS)):
+        bucket = (raw.timestamp // width) * width
+        source = select(raw.device_id, bucket, func.sum(raw.total_consumption)).group_by(raw.device_id, bucket)
+        if device_id is not None:
+            source = source.where(raw.device_id == device_id)
+        source = source.where(raw.timestamp >= since)
+        if until is not None:
+            source = source.where(raw.timestamp < until)
+        db.execute(insert(model.__table__).from_select(["device_id", "timestamp", "total_consumption"], source))
+
+    # Lunar: lunile nu au lungime fixă, așa că le compunem din rollup-ul zilnic (câteva rânduri per device)
+    monthly: Dict[BucketKey, float] = {}
+    for row in scoped(db.query(models.DailyRollup), models.DailyRollup):
+        key = (row.device_id, month_start(row.timestamp))
+        monthly[key] = monthly.get(key, 0.0) + row.total_consumption
+    crud.upsert_increment(db, models.MonthlyRollup.__table__, monthly, returning=False)
+
+    db.commit()
+
+
+def backfill_if_empty(db: Session):
+    """
+    La prima pornire după introducerea rollup-urilor, le construim din datele existente.
+    Cu mai multe replici, doar prima care ia lock-ul de mentenanță reconstruiește; celelalte
+    așteaptă lock-ul și găsesc apoi tabelele deja pline.
+    """
+    try:
+        if db.get_bind().dialect.name == "postgresql":
+            # Lock de tranzacție: eliberat la commit-ul din rebuild (sau la rollback-ul de mai jos)
+            db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MAINTENANCE_LOCK_ID})
+        if db.query(models.HourlyRollup.device_id).first() is not None:
+            return
+        if db.query(models.HourlyConsumption.device_id).first() is None:
+            return
+        print(" [ROLLUP] Rollup tables are empty, rebuilding from raw buckets...", flush=True)
+        rebuild(db)
+    finally:
+        db.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild consumption rollups from raw buckets")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--device", type=int, default=None, help="only this device_id")
+    parser.add_argument("--since", type=int, default=None, help="only periods from this timestamp (ms)")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    try:
+        rebuild(db, device_id=args.device, since=args.since)
+        print(" [ROLLUP] Rebuild done.", flush=True)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,13 @@
 from pydantic import BaseModel
-from typing import List
 
 class ConsumptionBase(BaseModel):
     timestamp: int
     total_consumption: float
 
-class ConsumptionRecord(ConsumptionBase):
-    id: int
-    device_id: int
 
-    class Config:
-        from_attributes = True
\ No newline at end of file
+class ConsumptionBucket(ConsumptionBase):
+    """
+    Un punct din istoric, agregat la rezoluția cerută (10m, 1h, 1d, 1w, 1mo).
+    `timestamp` e începutul bucket-ului în UTC: ora / ziua / săptămâna (luni, 00:00) / luna (ziua 1).
+    """
+    device_id: int
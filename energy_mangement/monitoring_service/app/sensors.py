@@ -0,0 +1,213 @@
+import json
+import os
+import time
+
+import numpy as np
+import pika
+from sqlalchemy.orm import Session
+
+from . import database, ingestion, rollups
+from .alerts import alert_tracker
+from .device_cache import device_limits
+from shared.rabbit_publisher import RabbitPublisher
+from shared.sensor_topology import (LEGACY_SENSOR_QUEUE, declare_dead_letter_topology, declare_sensor_topology,
+                                     shard_queue)
+
+# Config RabbitMQ
+RABBIT_HOST = os.getenv("RABBIT_HOST", "rabbitmq")
+QUEUE_SENSOR_DATA = LEGACY_SENSOR_QUEUE
+# Exchange direct pentru notificări (routing key: user.<id>); fiecare replică websocket_service
+# își leagă coada doar de utilizatorii conectați la ea
+EXCHANGE_NOTIFICATIONS = "notifications"
+# Exchange topic pentru actualizările live de consum (routing key: device.<id>); replicile
+# websocket_service leagă doar device-urile urmărite de clienții lor, restul update-urilor sunt
+# aruncate de broker (nerutabile)
+EXCHANGE_CONSUMPTION_UPDATES = "consumption_updates"
+
+# Ingestie în loturi: SENSOR_BATCH_MODE=0 revine la procesarea mesaj-cu-mesaj
+# (dimensiunea lotului / intervalul de flush se configurează în ingestion.py)
+SENSOR_BATCH_MODE = os.getenv("SENSOR_BATCH_MODE", "1") == "1"
+
+publisher = RabbitPublisher(host=RABBIT_HOST, name="notification-publisher")
+publisher.declare_exchange(EXCHANGE_NOTIFICATIONS, "direct")
+publisher.declare_exchange(EXCHANGE_CONSUMPTION_UPDATES, "topic")
+
+
+def send_notification(user_id: int, message: str, device_id: int):
+    payload = {
+        "user_id": user_id,
+        "message": message,
+        "device_id": device_id
+    }
+
+    # Publisher-ul comun: fără conexiune nouă per alertă, trimiterea se face din fundal
+    if publisher.publish(routing_key=f"user.{user_id}", body=json.dumps(payload), exchange=EXCHANGE_NOTIFICATIONS):
+        print(f" [ALERT] Queued notification for User {user_id}", flush=True)
+
+
+def check_limit(db: Session, device_id: int, interval_timestamp: int, current_total: float, device_settings):
+    """ Compară totalul bucket-ului cu limita device-ului și trimite alerta (o dată per prag) """
+    if not device_settings:
+        print(f" [DEBUG] ❌ Device {device_id} NOT FOUND in 'monitored_devices' table!", flush=True)
+        print(" [DEBUG] Hint: Did you sync the device or insert it manually?", flush=True)
+        return
+
+    max_limit = device_settings.max_hourly_consumption
+
+    print(f" [DEBUG] 🔍 Checking Limit: Current ({current_total}) > Max ({max_limit})?", flush=True)
+
+    if not max_limit or max_limit <= 0 or current_total <= max_limit:
+        print(" [DEBUG] ✅ Limit OK (or limit is 0). No alert sent.", flush=True)
+        return
+
+    tier = alert_tracker.should_alert(device_id, interval_timestamp, current_total, max_limit)
+    if tier is None:
+        print(" [DEBUG] 🔕 Limit exceeded, but already notified for this interval (or in cooldown).", flush=True)
+        return
+
+    print(f" [DEBUG] 🚨 LIMIT EXCEEDED (tier {tier})! Sending alert...", flush=True)
+    # Salvăm starea înainte de trimitere: după un restart nu mai retrimitem aceeași alertă
+    alert_tracker.record(db, device_id, interval_timestamp, tier)
+
+    percent = current_total / max_limit * 100
+    msg = f"Alert! Device {device_id} exceeded limit ({percent:.0f}%)! Current: {current_total:.2f}, Max: {max_limit}"
+    send_notification(device_settings.user_id, msg, device_id)
+
+
+def check_batch_limits(db: Session, totals: dict):
+    """
+    Verifică limitele pentru toate bucket-urile scrise într-un lot. Comparația totalurilor cu
+    limitele se face vectorizat; doar bucket-urile peste limită trec prin logica de alertă.
+    """
+    if not totals:
+        return
+
+    # Limitele vin din cache-ul local; DB-ul e citit doar pentru device-urile necunoscute
+    settings = device_limits.get_many({device_id for device_id, _ in totals}, db)
+
+    # În ordinea intervalelor, ca escaladările dintr-un lot să fie evaluate corect
+    keys = sorted(totals)
+    current = np.fromiter((totals[key] for key in keys), dtype=np.float64, count=len(keys))
+    limits = np.fromiter(
+        ((settings[device_id].max_hourly_consumption or 0.0) if device_id in settings else np.nan
+         for device_id, _ in keys),
+        dtype=np.float64, count=len(keys)
+    )
+
+    for index in np.flatnonzero(np.isnan(limits)):
+        check_limit(db, keys[index][0], keys[index][1], float(current[index]), None)
+
+    with np.errstate(invalid="ignore"):
+        exceeded = (limits > 0) & (current > limits)
+    for index in np.flatnonzero(exceeded):
+        device_id, interval_timestamp = keys[index]
+        check_limit(db, device_id, interval_timestamp, float(current[index]), settings[device_id])
+
+
+def publish_bucket_updates(folded: dict, totals: dict, period_totals: dict):
+    """
+    Anunță pe exchange-ul topic noile totaluri, ca graficele live să nu mai facă polling.
+    Update-ul poartă totalul bucket-ului și al perioadelor lui (oră/zi/lună), nu doar delta:
+    clientul îl poate aplica peste istoricul citit prin HTTP fără să numere ceva de două ori.
+    """
+    for (device_id, interval_timestamp), current_total in totals.items():
+        periods = {}
+        for model, period_start in rollups.ROLLUPS:
+            resolution = rollups.ROLLUP_RESOLUTIONS[model]
+            start = period_start(interval_timestamp)
+            total = period_totals.get(resolution, {}).get((device_id, start))
+            if total is not None:
+                periods[resolution] = {"timestamp": start, "total_consumption": total}
+        update = {
+            "type": "consumption",
+            "device_id": device_id,
+            "timestamp": interval_timestamp,
+            "total_consumption": current_total,
+            "delta": folded.get((device_id, interval_timestamp), 0.0),
+            "periods": periods,
+        }
+        publisher.publish(routing_key=f"device.{device_id}", body=json.dumps(update),
+                          exchange=EXCHANGE_CONSUMPTION_UPDATES)
+
+
+def on_batch_written(db: Session, folded: dict, totals: dict, period_totals: dict):
+    """ Apelat după fiecare lot scris în DB """
+    publish_bucket_updates(folded, totals, period_totals)
+    check_batch_limits(db, totals)
+
+
+def process_sensor_message(ch, method, properties, body):
+    """ Procesează datele de consum cu DEBUG LOGGING (ack manual, după commit) """
+    try:
+        # JSON sau frame binar (content_type); un frame poate conține mai multe citiri
+        readings = ingestion.parse_readings(properties, body)
+    except Exception as e:
+        ingestion.dead_letter(ch, QUEUE_SENSOR_DATA, properties, body, f"parse error: {e}")
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        return
+
+    for device_id, _, measurement in readings:
+        print(f" [SENSOR] Received: Device {device_id}, Value {measurement}", flush=True)
+
+    db = database.SessionLocal()
+    try:
+        # 1-2. Rotunjim la interval, însumăm și salvăm (UPSERT atomic; relivrările sunt ignorate)
+        try:
+            folded, totals, period_totals = ingestion.ingest_readings(db, readings)
+        except Exception as e:
+            db.rollback()
+            if ingestion.is_transient(e):
+                print(f"Error processing sensor message: {e}. Requeueing.", flush=True)
+                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+                time.sleep(1)
+            else:
+                ingestion.dead_letter(ch, QUEUE_SENSOR_DATA, properties, body, f"persist error: {e}")
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+            return
+
+        for (device_id, _), current_total in totals.items():
+            print(f" [DB] Total Consumption for Device {device_id} is now: {current_total}", flush=True)
+
+        # 3. Live update + VERIFICAREA PENTRU ALERTĂ (limitele din cache, cu fallback pe DB la miss)
+        try:
+            on_batch_written(db, folded, totals, period_totals)
+        except Exception as e:
+            db.rollback()
+            print(f"Error evaluating alerts for sensor message: {e}", flush=True)
+    finally:
+        db.close()
+
+    ch.basic_ack(delivery_tag=method.delivery_tag)
+
+
+def start_shard_consumer(shard: int, shards: int):
+    """ Consumă coada unui singur shard (rulează în procesul worker-ului acelui shard) """
+    ingestion.start_batched_sensor_consumer(
+        RABBIT_HOST, shard_queue(shard), on_batch_written,
+        declare=lambda channel: declare_sensor_topology(channel, shards)
+    )
+
+
+def start_sensor_consumer():
+    """ Thread care ascultă coada 'sensor_data' """
+    if SENSOR_BATCH_MODE:
+        ingestion.start_batched_sensor_consumer(RABBIT_HOST, QUEUE_SENSOR_DATA, on_batch_written)
+        return
+
+    while True:
+        try:
+            print(" [*] [SENSOR] Connecting to RabbitMQ...", flush=True)
+            connection = pika.BlockingConnection(
+                pika.ConnectionParameters(host=RABBIT_HOST, heartbeat=600, blocked_connection_timeout=300)
+            )
+            channel = connection.channel()
+            channel.confirm_delivery()
+            channel.queue_declare(queue=QUEUE_SENSOR_DATA, durable=True)
+            declare_dead_letter_topology(channel)
+            channel.basic_qos(prefetch_count=ingestion.SENSOR_PREFETCH)
+            channel.basic_consume(queue=QUEUE_SENSOR_DATA, on_message_callback=process_sensor_message)
+            print(' [*] [SENSOR] Connected! Waiting for measurements.', flush=True)
+            channel.start_consuming()
+        except Exception as e:
+            print(f" [!] [SENSOR] Connection lost: {e}. Retrying in 5s...", flush=True)
+            time.sleep(5)
@@ -0,0 +1,210 @@
+"""
+Scale-out pentru ingestie: citirile sunt partiționate după device_id pe SENSOR_SHARDS cozi
+(vezi shared/sensor_topology.py), iar fiecare shard deținut de această replică e consumat
+de un proces worker separat, cu propriul cache de limite și propria stare de alertă.
+
+Exemplu cu 4 shard-uri pe 2 replici: SENSOR_SHARDS=4, replica A SENSOR_SHARD_IDS=0,1,
+replica B SENSOR_SHARD_IDS=2,3. Fără SENSOR_SHARD_IDS, replica deține toate shard-urile.
+
+Test de scalare (ingestia pe 1, 2, 4 procese, fiecare cu device-urile shard-ului său; pentru
+rezultate relevante DATABASE_URL trebuie să fie PostgreSQL, SQLite serializează scrierile):
+
+    python -m app.sharding bench --workers 1,2,4 --readings 200000
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import threading
+import time
+from typing import Dict, List
+
+import pika
+
+from . import database, ingestion, models, sensors
+from .alerts import alert_tracker
+from .device_cache import device_limits
+from shared import sensor_codec
+from shared.sensor_codec import CONTENT_TYPE_BINARY
+from shared.sensor_topology import shard_for
+
+SENSOR_SHARDS = int(os.getenv("SENSOR_SHARDS", "0"))  # 0 = fără sharding (doar coada 'sensor_data')
+EXCHANGE_DEVICE_SYNC = "device_sync"  # fanout: coada durabilă + câte o coadă exclusivă per proces
+
+
+def owned_shards() -> List[int]:
+    ids = os.getenv("SENSOR_SHARD_IDS", "").strip()
+    if not ids:
+        return list(range(SENSOR_SHARDS))
+    return [int(shard) for shard in ids.split(",") if shard.strip()]
+
+
+def drains_legacy_queue() -> bool:
+    """
+    Coada veche 'sensor_data' (producători care nu publică încă pe shard-uri). Fără sharding o
+    consumă fiecare replică. Cu sharding o golește doar replica ce deține shard-ul 0: altfel toate
+    replicile ar concura pe o coadă nepartiționată, pe lângă worker-ii lor de shard.
+    """
+    return SENSOR_SHARDS <= 0 or 0 in owned_shards()
+
+
+def sync_events(data: dict) -> List[dict]:
+    """ Un mesaj de sync e fie un singur eveniment, fie un lot: {"operation": "BATCH", "events": [...]} """
+    if data.get("operation") == "BATCH":
+        return data.get("events") or []
+    return [data]
+
+
+def apply_sync_to_cache(data: dict):
+    """ Aplică un mesaj de sincronizare (eveniment sau lot) doar pe starea din memorie a procesului curent """
+    for event in sync_events(data):
+        device_id = event.get("device_id")
+        if event.get("operation") in ["CREATE", "UPDATE"]:
+            device_limits.put(device_id, event.get("user_id"), event.get("max_hourly_consumption"))
+        elif event.get("operation") == "DELETE":
+            device_limits.evict(device_id)
+            alert_tracker.forget(device_id)
+
+
+def start_cache_listener():
+    """
+    Thread care ține la zi cache-ul de limite al procesului. Scrierea în DB rămâne treaba
+    consumatorului 'device_sync_queue'; aici primim doar o copie a evenimentelor (fanout).
+    """
+    while True:
+        try:
+            connection = pika.BlockingConnection(
+                pika.ConnectionParameters(host=sensors.RABBIT_HOST, heartbeat=600, blocked_connection_timeout=300)
+            )
+            channel = connection.channel()
+            channel.exchange_declare(exchange=EXCHANGE_DEVICE_SYNC, exchange_type="fanout", durable=True)
+            queue_name = channel.queue_declare(queue="", exclusive=True, auto_delete=True).method.queue
+            channel.queue_bind(exchange=EXCHANGE_DEVICE_SYNC, queue=queue_name)
+
+            def callback(ch, method, properties, body):
+                try:
+                    apply_sync_to_cache(json.loads(body))
+                except Exception as e:
+                    print(f"Error applying sync event to cache: {e}", flush=True)
+
+            channel.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=True)
+            print(" [*] [CACHE] Listening for device sync events.", flush=True)
+            channel.start_consuming()
+        except Exception as e:
+            print(f" [!] [CACHE] Connection lost: {e}. Retrying in 5s...", flush=True)
+            time.sleep(5)
+
+
+def run_shard_worker(shard: int, shards: int):
+    """ Punctul de intrare al procesului worker pentru un shard """
+    print(f" [*] [SHARD {shard}/{shards}] Worker started (pid {os.getpid()})", flush=True)
+    db = database.SessionLocal()
+    try:
+        device_limits.load_all(db)
+        alert_tracker.load(db)
+    finally:
+        db.close()
+
+    sensors.publisher.start()
+    threading.Thread(target=start_cache_listener, daemon=True).start()
+    sensors.start_shard_consumer(shard, shards)
+
+
+def start_shard_workers():
+    """ Pornește câte un proces per shard deținut și le repornește dacă se opresc """
+    if SENSOR_SHARDS <= 0:
+        return
+
+    context = multiprocessing.get_context("spawn")
+    workers: Dict[int, multiprocessing.Process] = {}
+
+    def spawn(shard: int):
+        process = context.Process(target=run_shard_worker, args=(shard, SENSOR_SHARDS),
+                                  name=f"sensor-shard-{shard}", daemon=True)
+        process.start()
+        workers[shard] = process
+
+    for shard in owned_shards():
+        spawn(shard)
+
+    def supervise():
+        while True:
+            time.sleep(5)
+            for shard, process in list(workers.items()):
+                if not process.is_alive():
+                    print(f" [!] [SHARD {shard}] Worker exited ({process.exitcode}). Restarting...", flush=True)
+                    spawn(shard)
+
+    threading.Thread(target=supervise, daemon=True).start()
+    print(f" [*] [SHARD] Started workers for shards {owned_shards()} of {SENSOR_SHARDS}", flush=True)
+
+
+# ==================================================================================
+# TEST DE SCALARE
+# ==================================================================================
+
+class _Properties:
+    content_type = CONTENT_TYPE_BINARY
+
+
+def _bench_worker(frames: List[bytes], done: "multiprocessing.Queue"):
+    """ Un proces = un shard: decodează frame-urile și le scrie în loturi, ca SensorBatcher """
+    db = database.SessionLocal()
+    try:
+        written = 0
+        for frame in frames:
+            readings = ingestion.parse_readings(_Properties(), frame)
+            ingestion.ingest_readings(db, readings)
+            written += len(readings)
+        done.put(written)
+    finally:
+        db.close()
+
+
+def _bench_run(workers: int, readings: int, devices: int, batch_size: int) -> float:
+    # Timestamp-uri noi la fiecare rulare: dedup-ul nu trebuie să sară citiri
+    base = int(time.time() * 1000)
+    per_shard: Dict[int, list] = {shard: [] for shard in range(workers)}
+    for i in range(readings):
+        device_id = random.randint(1, devices)
+        per_shard[shard_for(device_id, workers)].append((device_id, base + i, random.uniform(0.5, 2.5)))
+    frames = {
+        shard: [sensor_codec.encode_binary(rows[start:start + batch_size]) for start in range(0, len(rows), batch_size)]
+        for shard, rows in per_shard.items()
+    }
+
+    context = multiprocessing.get_context("spawn")
+    done = context.Queue()
+    processes = [context.Process(target=_bench_worker, args=(frames[shard], done)) for shard in range(workers)]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    written = sum(done.get() for _ in processes)
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+    return written / elapsed
+
+
+def _benchmark(workers: List[int], readings: int, devices: int, batch_size: int):
+    models.Base.metadata.create_all(bind=database.engine)
+    print(f" [BENCH] {readings} readings, {devices} devices, batch={batch_size}, "
+          f"db={database.engine.dialect.name}, cpus={os.cpu_count()}", flush=True)
+    baseline = None
+    for count in workers:
+        rate = _bench_run(count, readings, devices, batch_size)
+        baseline = baseline or rate / count
+        print(f" [BENCH] workers={count:<3} {rate:10,.0f} readings/s  "
+              f"(scaling efficiency {rate / (baseline * count):.0%})", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded ingestion throughput vs number of worker processes")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--workers", default="1,2,4", help="listă de numere de procese, ex: 1,2,4")
+    parser.add_argument("--readings", type=int, default=200000)
+    parser.add_argument("--devices", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=ingestion.SENSOR_BATCH_SIZE)
+    args = parser.parse_args()
+    _benchmark([int(n) for n in args.workers.split(",")], args.readings, args.devices, args.batch)
@@ -0,0 +1,83 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Tuple
+
+from jose import jwt
+
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+# O intrare nu trăiește mai mult de atât, chiar dacă token-ul expiră mai târziu
+JWT_CACHE_TTL_SECONDS = float(os.getenv("JWT_CACHE_TTL_SECONDS", "300"))
+
+
+class JWTCache:
+    """
+    Cache LRU cu TTL pentru token-urile JWT deja verificate, folosit de device_service și user_service.
+
+    Cheia e hash-ul SHA-256 al token-ului (nu păstrăm token-ul în clar). O intrare expiră la
+    min(exp din token, momentul verificării + ttl), deci un token expirat nu e acceptat nici din cache.
+    Token-urile invalide nu se cachează: fiecare încercare trece prin verificarea completă.
+    """
+
+    def __init__(self, secret_key: str, algorithms: List[str], max_size: int = JWT_CACHE_SIZE,
+                 ttl_seconds: float = JWT_CACHE_TTL_SECONDS):
+        self.secret_key = secret_key
+        self.algorithms = algorithms
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[bytes, Tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def decode(self, token: str) -> dict:
+        """ Ca jwt.decode (aruncă JWTError pentru token-uri invalide), dar fără re-verificare la hit """
+        key = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, payload = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return payload
+                del self._entries[key]
+                self.expired += 1
+            self.misses += 1
+
+        payload = jwt.decode(token, self.secret_key, algorithms=self.algorithms)
+
+        expires_at = now + self.ttl_seconds
+        if isinstance(payload.get("exp"), (int, float)):
+            expires_at = min(expires_at, payload["exp"])
+
+        with self._lock:
+            self._entries[key] = (expires_at, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return payload
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,48 @@
+import hashlib
+import json
+from typing import List, Optional, Sequence
+
+from fastapi import HTTPException, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+
+# Header-ele pe care frontend-ul trebuie să le poată citi (CORS expose_headers)
+LISTING_HEADERS = ["X-Next-Cursor", "ETag"]
+
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str]) -> List[str]:
+    """
+    Coloanele cerute prin ?fields=a,b,c (implicit toate cele din `allowed`).
+    `id` e inclus mereu: pe el se face paginarea cu cursor.
+    """
+    if not fields:
+        return list(allowed)
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = sorted(set(requested) - set(allowed))
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Unknown fields: {unknown}. Allowed: {list(allowed)}")
+    return ["id"] + [name for name in dict.fromkeys(requested) if name != "id"]
+
+
+def listing_response(request: Request, rows: List[dict], limit: int) -> Response:
+    """
+    Răspunsul unei pagini de listare. `rows` are cel mult limit + 1 elemente: al (limit+1)-lea
+    doar semnalează că mai există o pagină, iar X-Next-Cursor e id-ul ultimului rând trimis.
+
+    ETag-ul e hash-ul conținutului paginii; dacă clientul trimite același ETag în If-None-Match,
+    răspundem 304 fără body. Cu "Cache-Control: no-cache" browser-ul revalidează singur la fiecare
+    cerere, deci un refresh fără modificări nu mai transferă / re-randează lista.
+    """
+    headers = {"Cache-Control": "private, no-cache"}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = str(rows[-1]["id"])
+
+    body = json.dumps(jsonable_encoder(rows), separators=(",", ":")).encode()
+    etag = '"' + hashlib.sha1(body + headers.get("X-Next-Cursor", "").encode()).hexdigest() + '"'
+    headers["ETag"] = etag
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,268 @@
+"""
+Publisher RabbitMQ partajat de servicii (conexiune persistentă + buffer + thread de fundal).
+
+Benchmark latență publish (necesită broker): vechiul mod (conexiune nouă per mesaj) vs RabbitPublisher
+
+    python -m shared.rabbit_publisher --host localhost --messages 2000
+"""
+import argparse
+import os
+import queue
+import threading
+import time
+from typing import List, Optional
+
+import pika
+from pika.exceptions import AMQPError
+
+
+# Câte mesaje pleacă într-un lot confirmat (commit) o singură dată
+PUBLISH_BATCH_SIZE = int(os.getenv("PUBLISH_BATCH_SIZE", "200"))
+# De câte ori încercăm un lot care eșuează cu o eroare neașteptată (nu de conexiune) înainte să-l aruncăm
+PUBLISH_MAX_ATTEMPTS = 3
+
+
+class RabbitPublisher:
+    """
+    Publisher RabbitMQ reutilizabil, folosit de device_service, chat_service și monitoring_service.
+
+    - o singură conexiune și un singur canal, ținute deschise pe toată durata serviciului
+    - publish() doar pune mesajul într-un buffer limitat și revine imediat (nu blochează request-ul)
+    - un thread de fundal golește buffer-ul în loturi (PUBLISH_BATCH_SIZE), cu reconectare automată
+    - cu `transactional`, fiecare lot e publicat într-o tranzacție AMQP (tx_select / tx_commit):
+      broker-ul confirmă tot lotul printr-un singur tx_commit-ok; un lot fără commit e retrimis
+      (at-least-once). Nu folosim publisher confirms (confirm_delivery): pe BlockingConnection
+      fiecare basic_publish ar aștepta propriul ack, adică un round-trip per mesaj.
+
+    Pika nu este thread-safe, de aceea conexiunea e folosită DOAR din thread-ul de fundal.
+    """
+
+    def __init__(self, host: str, max_buffer: int = 10000, transactional: bool = True, name: str = "publisher"):
+        self.host = host
+        self.transactional = transactional
+        self.name = name
+        self._buffer: "queue.Queue" = queue.Queue(maxsize=max_buffer)
+        self._queues = {}  # nume coadă -> durable
+        self._exchanges = {}  # nume exchange -> tip
+        self._bindings = set()  # (coadă, exchange, routing key)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+        self.published = 0
+        self.dropped = 0
+        self.failed = 0
+        self.reconnects = 0
+        self.batches = 0
+        self._commit_ms_total = 0.0
+
+    # --- API folosit de servicii ---
+
+    def declare_queue(self, name: str, durable: bool = True):
+        """ Coada e declarată o dată la fiecare (re)conectare, nu la fiecare mesaj """
+        self._queues[name] = durable
+
+    def declare_exchange(self, name: str, exchange_type: str = "direct"):
+        self._exchanges[name] = exchange_type
+
+    def bind_queue(self, queue_name: str, exchange: str, routing_key: str = ""):
+        self._bindings.add((queue_name, exchange, routing_key))
+
+    def publish(self, routing_key: str, body, exchange: str = "", properties=None) -> bool:
+        """ Pune mesajul în buffer. Returnează False dacă buffer-ul e plin (mesaj pierdut). """
+        # Erorile de serializare apar aici, la apelant, nu în thread-ul de fundal
+        if isinstance(body, str):
+            body = body.encode()
+        elif not isinstance(body, (bytes, bytearray)):
+            raise TypeError(f"message body must be str or bytes, not {type(body).__name__}")
+        self.start()
+        try:
+            self._buffer.put_nowait((exchange, routing_key, body, properties, time.perf_counter()))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            print(f" [{self.name}] Outbound buffer full, message to '{routing_key}' dropped", flush=True)
+            return False
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def close(self, timeout: float = 5.0):
+        """ Așteaptă (maxim `timeout` secunde) golirea buffer-ului, apoi oprește thread-ul """
+        deadline = time.monotonic() + timeout
+        while not self._buffer.empty() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(deadline - time.monotonic(), 0.5))
+
+    def stats(self) -> dict:
+        committed = self.published
+        return {
+            "buffered": self._buffer.qsize(),
+            "published": self.published,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "reconnects": self.reconnects,
+            "batches": self.batches,
+            "alive": self._thread is not None and self._thread.is_alive(),
+            # timpul de la publish() până la commit-ul lotului în broker
+            "avg_publish_latency_ms": round(self._commit_ms_total / committed, 3) if committed else 0.0,
+        }
+
+    # --- Thread-ul de fundal ---
+
+    def _connect(self):
+        connection = pika.BlockingConnection(
+            pika.ConnectionParameters(host=self.host, heartbeat=60, blocked_connection_timeout=30)
+        )
+        channel = connection.channel()
+        if self.transactional:
+            channel.tx_select()
+        for name, exchange_type in list(self._exchanges.items()):
+            channel.exchange_declare(exchange=name, exchange_type=exchange_type, durable=True)
+        for name, durable in list(self._queues.items()):
+            channel.queue_declare(queue=name, durable=durable)
+        for queue_name, exchange, routing_key in list(self._bindings):
+            channel.queue_bind(queue=queue_name, exchange=exchange, routing_key=routing_key)
+        return connection, channel
+
+    def _next_batch(self) -> List[tuple]:
+        """ Primul mesaj cu așteptare (max 1s), restul doar cât sunt deja în buffer """
+        batch = [self._buffer.get(timeout=1.0)]
+        while len(batch) < PUBLISH_BATCH_SIZE:
+            try:
+                batch.append(self._buffer.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        connection = None
+        channel = None
+        pending: List[tuple] = []  # lotul curent; rămâne aici până la commit (retrimis după reconectare)
+        attempts = 0
+        backoff = 1.0
+
+        while not self._stopping.is_set() or pending or not self._buffer.empty():
+            try:
+                if connection is None or connection.is_closed:
+                    connection, channel = self._connect()
+                    print(f" [{self.name}] Connected to RabbitMQ", flush=True)
+                    backoff = 1.0
+
+                if not pending:
+                    try:
+                        pending = self._next_batch()
+                        attempts = 0
+                    except queue.Empty:
+                        # Menținem heartbeat-ul conexiunii cât timp nu avem ce trimite
+                        connection.process_data_events(time_limit=0)
+                        continue
+
+                for exchange, routing_key, body, properties, _ in pending:
+                    channel.basic_publish(exchange=exchange, routing_key=routing_key, body=body,
+                                          properties=properties)
+                if self.transactional:
+                    channel.tx_commit()  # un singur round-trip pentru tot lotul
+
+                now = time.perf_counter()
+                self._commit_ms_total += sum((now - item[4]) * 1000 for item in pending)
+                self.published += len(pending)
+                self.batches += 1
+                pending = []
+
+            except Exception as e:
+                # Orice eroare (nu doar AMQPError / OSError): thread-ul nu trebuie să moară,
+                # altfel buffer-ul se umple în tăcere
+                self.failed += 1
+                self.reconnects += 1
+                if not isinstance(e, (AMQPError, OSError)):
+                    attempts += 1
+                    if attempts >= PUBLISH_MAX_ATTEMPTS and pending:
+                        self.dropped += len(pending)
+                        print(f" [{self.name}] Dropping batch of {len(pending)} messages after "
+                              f"{attempts} failed attempts: {e!r}", flush=True)
+                        pending = []
+                print(f" [{self.name}] RabbitMQ error: {e!r}. Reconnecting in {backoff:.0f}s...", flush=True)
+                try:
+                    if connection is not None and connection.is_open:
+                        connection.close()
+                except Exception:
+                    pass
+                connection = None
+                if self._stopping.is_set():
+                    break
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+        if connection is not None and connection.is_open:
+            connection.close()
+
+
+# ==================================================================================
+# BENCHMARK
+# ==================================================================================
+
+BENCHMARK_QUEUE = "publisher_benchmark"
+
+
+def _report(name: str, latencies: list, elapsed: float):
+    latencies = sorted(latencies)
+    pick = lambda p: latencies[min(int(len(latencies) * p / 100.0), len(latencies) - 1)] * 1000
+    print(f" [BENCH] {name:<34} n={len(latencies)} p50={pick(50):.3f}ms p99={pick(99):.3f}ms "
+          f"({len(latencies) / elapsed:.0f} msg/s)", flush=True)
+
+
+def _benchmark(host: str, messages: int):
+    body = b'{"type": "benchmark"}'
+
+    # 1. Vechiul mod: conexiune + declare + publish + close la fiecare mesaj (blochează apelantul)
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(messages):
+        sent_at = time.perf_counter()
+        connection = pika.BlockingConnection(pika.ConnectionParameters(host=host))
+        channel = connection.channel()
+        channel.queue_declare(queue=BENCHMARK_QUEUE, durable=True)
+        channel.basic_publish(exchange="", routing_key=BENCHMARK_QUEUE, body=body)
+        connection.close()
+        latencies.append(time.perf_counter() - sent_at)
+    _report("connection per message", latencies, time.perf_counter() - started)
+
+    # 2. RabbitPublisher: cât stă apelantul în publish() și cât până la commit-ul lotului în broker
+    publisher = RabbitPublisher(host=host, max_buffer=messages + 1, name="benchmark-publisher")
+    publisher.declare_queue(BENCHMARK_QUEUE)
+    publisher.start()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(messages):
+        sent_at = time.perf_counter()
+        publisher.publish(routing_key=BENCHMARK_QUEUE, body=body)
+        latencies.append(time.perf_counter() - sent_at)
+    _report("RabbitPublisher.publish() (caller)", latencies, time.perf_counter() - started)
+    while publisher.stats()["published"] + publisher.dropped < messages:
+        time.sleep(0.01)
+    drained = time.perf_counter() - started
+    stats = publisher.stats()
+    print(f" [BENCH] RabbitPublisher publish -> commit: avg={stats['avg_publish_latency_ms']}ms "
+          f"batches={stats['batches']} published={stats['published']} "
+          f"({stats['published'] / drained:.0f} msg/s end-to-end)", flush=True)
+    publisher.close()
+
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=host))
+    connection.channel().queue_delete(queue=BENCHMARK_QUEUE)
+    connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish latency: connection per message vs RabbitPublisher")
+    parser.add_argument("--host", default=os.getenv("RABBIT_HOST", "localhost"))
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+    _benchmark(args.host, args.messages)
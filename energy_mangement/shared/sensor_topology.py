@@ -0,0 +1,39 @@
+"""
+Topologia RabbitMQ pentru citirile senzorilor, partiționate (sharded) după device_id.
+
+Producătorii publică pe exchange-ul direct SENSOR_EXCHANGE cu routing key = shard-ul device-ului;
+fiecare shard are propria coadă durabilă, consumată de un singur worker. Astfel toate citirile
+unui device ajung mereu la același worker (afinitate), care îi deține starea de agregare/alertă.
+"""
+
+SENSOR_EXCHANGE = "sensor_data_sharded"
+# Coada veche, nepartiționată (producătorii care nu știu de shard-uri)
+LEGACY_SENSOR_QUEUE = "sensor_data"
+
+
+def shard_for(device_id: int, shards: int) -> int:
+    return int(device_id) % shards
+
+
+def shard_queue(shard: int) -> str:
+    return f"sensor_data.shard.{shard}"
+
+
+def declare_sensor_topology(channel, shards: int):
+    """ Idempotent: poate fi apelat atât de producători, cât și de consumatori """
+    channel.exchange_declare(exchange=SENSOR_EXCHANGE, exchange_type="direct", durable=True)
+    for shard in range(shards):
+        channel.queue_declare(queue=shard_queue(shard), durable=True)
+        channel.queue_bind(queue=shard_queue(shard), exchange=SENSOR_EXCHANGE, routing_key=str(shard))
+
+
+# Mesajele care nu pot fi parsate sau salvate ajung aici (publicate explicit de consumator,
+# nu prin x-dead-letter-exchange, ca să nu redeclarăm cozile existente cu alte argumente)
+SENSOR_DLX = "sensor_data.dlx"
+SENSOR_DLQ = "sensor_data.dlq"
+
+
+def declare_dead_letter_topology(channel):
+    channel.exchange_declare(exchange=SENSOR_DLX, exchange_type="fanout", durable=True)
+    channel.queue_declare(queue=SENSOR_DLQ, durable=True)
+    channel.queue_bind(queue=SENSOR_DLQ, exchange=SENSOR_DLX)
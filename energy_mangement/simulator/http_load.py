@@ -0,0 +1,145 @@
+"""
+Load test HTTP pentru API-urile serviciilor (doar biblioteca standard, asyncio).
+N clienți concurenți, fiecare cu propria conexiune keep-alive, trimit cereri cât de repede pot;
+la final raportează requests/s și percentilele latenței.
+
+    python http_load.py http://localhost/devices/ --concurrency 50 --duration 30 -H "Authorization: Bearer <token>"
+    python http_load.py "http://localhost/monitoring/consumption/7?resolution=1h&limit=24" -c 100
+    python http_load.py http://localhost/auth/login -X POST --form "username=admin&password=admin" -c 100
+
+Pentru comparația sync vs async se rulează același scenariu pe ambele versiuni ale serviciului.
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+
+def percentile(sorted_values, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * p / 100.0), len(sorted_values) - 1)]
+
+
+class HttpLoadStats:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = 0
+
+
+async def read_response(reader) -> int:
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed by server")
+    status = int(status_line.split()[1])
+
+    length = None
+    chunked = False
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        name = name.strip().lower()
+        if name == "content-length":
+            length = int(value.strip())
+        elif name == "transfer-encoding" and "chunked" in value.lower():
+            chunked = True
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length:
+        await reader.readexactly(length)
+    return status
+
+
+async def client(args, target, request: bytes, deadline: float, stats: HttpLoadStats, budget: list):
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        if args.requests:
+            if budget[0] <= 0:
+                break
+            budget[0] -= 1
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(target.hostname, target.port or 80)
+            started = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status = await read_response(reader)
+            stats.latencies.append(time.perf_counter() - started)
+            stats.statuses[status] += 1
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+            stats.errors += 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.1)
+    if writer is not None:
+        writer.close()
+
+
+def build_request(args, target) -> bytes:
+    path = target.path or "/"
+    if target.query:
+        path += "?" + target.query
+    body = b""
+    headers = [f"Host: {target.netloc}", "Connection: keep-alive"]
+    if args.form is not None:
+        body = args.form.encode()
+        headers.append("Content-Type: application/x-www-form-urlencoded")
+    elif args.json is not None:
+        body = args.json.encode()
+        headers.append("Content-Type: application/json")
+    if body or args.method in ("POST", "PUT", "PATCH"):
+        headers.append(f"Content-Length: {len(body)}")
+    headers.extend(args.header)
+    return (f"{args.method} {path} HTTP/1.1\r\n" + "\r\n".join(headers) + "\r\n\r\n").encode() + body
+
+
+async def run(args):
+    target = urlsplit(args.url)
+    request = build_request(args, target)
+    stats = HttpLoadStats()
+    budget = [args.requests]
+
+    print(f" [HTTP] {args.method} {args.url} concurrency={args.concurrency} "
+          f"{'requests=' + str(args.requests) if args.requests else 'duration=' + str(args.duration) + 's'}")
+    started = time.perf_counter()
+    deadline = started + (args.duration if not args.requests else 10 ** 9)
+    await asyncio.gather(*(client(args, target, request, deadline, stats, budget) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(stats.latencies)
+    print(" [HTTP] ---------------- results ----------------")
+    print(f" [HTTP] requests={len(latencies)} errors={stats.errors} elapsed={elapsed:.1f}s "
+          f"throughput={len(latencies) / elapsed:.0f} req/s")
+    print(f" [HTTP] status codes: {dict(stats.statuses)}")
+    print(" [HTTP] latency ms: " + " ".join(
+        f"p{p}={percentile(latencies, p) * 1000:.1f}" for p in (50, 90, 99, 99.9)
+    ))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="HTTP load test for the service APIs")
+    parser.add_argument("url")
+    parser.add_argument("-c", "--concurrency", type=int, default=50, help="clienți concurenți")
+    parser.add_argument("-d", "--duration", type=float, default=30, help="secunde")
+    parser.add_argument("-n", "--requests", type=int, default=0, help="număr total de cereri (în loc de durată)")
+    parser.add_argument("-X", "--method", default="GET")
+    parser.add_argument("-H", "--header", action="append", default=[], help='ex: "Authorization: Bearer ..."')
+    parser.add_argument("--form", default=None, help="body application/x-www-form-urlencoded")
+    parser.add_argument("--json", default=None, help="body JSON")
+    args = parser.parse_args()
+    args.method = args.method.upper()
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
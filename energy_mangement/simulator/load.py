@@ -0,0 +1,196 @@
+"""
+Mod de încărcare (load) pentru simulator: un număr mic de conexiuni RabbitMQ care împart
+între ele o flotă mare de device-uri și publică la o rată totală țintă (citiri/secundă).
+
+    python main.py load --devices 50000 --rate 20000 --connections 4 --duration 60
+    python main.py replay --devices 1000 --hours 24 --connections 4      # back-dated, cât de repede se poate
+
+La final raportează throughput-ul obținut și percentilele latenței de publicare
+(cu --confirm, latența include confirmarea broker-ului).
+Cu --format binary --frame N, citirile pleacă împachetate câte N într-un mesaj (vezi shared/sensor_codec.py).
+"""
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pika
+
+from shared import sensor_codec
+from shared.sensor_codec import CONTENT_TYPE_BINARY, CONTENT_TYPE_JSON
+from shared.sensor_topology import LEGACY_SENSOR_QUEUE, SENSOR_EXCHANGE, declare_sensor_topology, shard_for
+
+# Câte măsurători de latență păstrăm per conexiune (reservoir sampling peste acest prag)
+LATENCY_SAMPLES = 100000
+INTERVAL_MS = 10 * 60 * 1000
+
+
+class PublisherStats:
+    def __init__(self):
+        self.sent = 0  # citiri
+        self.messages = 0
+        self.bytes = 0
+        self.errors = 0
+        self.latencies = []
+        self._seen = 0
+
+    def record(self, latency_s: float, readings: int = 1, size: int = 0):
+        self.sent += readings
+        self.messages += 1
+        self.bytes += size
+        self._seen += 1
+        if len(self.latencies) < LATENCY_SAMPLES:
+            self.latencies.append(latency_s)
+        else:
+            slot = random.randrange(self._seen)
+            if slot < LATENCY_SAMPLES:
+                self.latencies[slot] = latency_s
+
+
+def percentile(sorted_values, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(len(sorted_values) * p / 100.0), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run_connection(worker: int, device_ids, args, shards: int, stop: threading.Event, stats: PublisherStats):
+    """ O conexiune + un canal; publică pe rând pentru device-urile primite, la rata cerută """
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=args.host))
+    channel = connection.channel()
+    if args.confirm:
+        channel.confirm_delivery()
+    if shards > 0:
+        declare_sensor_topology(channel, shards)
+    else:
+        channel.queue_declare(queue=LEGACY_SENSOR_QUEUE, durable=True)
+
+    # Replay: pornim din trecut și avansăm cu 10 minute per mesaj al fiecărui device
+    if args.mode == "replay":
+        start_ms = int((datetime.now() - timedelta(hours=args.hours)).timestamp() * 1000)
+        end_ms = int(datetime.now().timestamp() * 1000)
+    else:
+        start_ms = end_ms = None
+    device_time = {device_id: start_ms for device_id in device_ids}
+
+    # rata per conexiune; 0 = fără limită
+    interval = args.connections / args.rate if args.rate > 0 else 0.0
+    next_send = time.perf_counter()
+    index = 0
+    frames = {}  # (exchange, routing key) -> citiri care așteaptă un frame binar
+    content_type = CONTENT_TYPE_BINARY if args.format == "binary" else CONTENT_TYPE_JSON
+    properties = pika.BasicProperties(content_type=content_type)
+
+    try:
+        while not stop.is_set() and device_ids:
+            device_id = device_ids[index % len(device_ids)]
+            index += 1
+
+            if start_ms is not None:
+                timestamp = device_time[device_id]
+                if timestamp >= end_ms:
+                    # Device-ul a ajuns în prezent; când toate au ajuns, oprim conexiunea
+                    device_ids.remove(device_id)
+                    continue
+                device_time[device_id] = timestamp + INTERVAL_MS
+            else:
+                # Strict crescător per device: două citiri diferite nu cad în aceeași milisecundă
+                timestamp = max(int(time.time() * 1000), (device_time[device_id] or 0) + 1)
+                device_time[device_id] = timestamp
+
+            reading = (device_id, timestamp, round(random.uniform(0.5, 2.5), 2))
+            if shards > 0:
+                exchange, routing_key = SENSOR_EXCHANGE, str(shard_for(device_id, shards))
+            else:
+                exchange, routing_key = '', LEGACY_SENSOR_QUEUE
+
+            if args.format == "binary":
+                # Adunăm până la --frame citiri per coadă destinație într-un singur mesaj
+                pending = frames.setdefault((exchange, routing_key), [])
+                pending.append(reading)
+                if len(pending) < args.frame:
+                    continue
+                body = sensor_codec.encode_binary(pending)
+                count = len(pending)
+                frames[(exchange, routing_key)] = []
+            else:
+                body = sensor_codec.encode_json(*reading)
+                count = 1
+
+            if interval:
+                next_send += interval * count
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            started = time.perf_counter()
+            try:
+                channel.basic_publish(exchange=exchange, routing_key=routing_key, body=body,
+                                      properties=properties)
+                stats.record(time.perf_counter() - started, count, len(body))
+            except pika.exceptions.AMQPError as e:
+                stats.errors += 1
+                print(f" [!] Connection {worker}: publish failed: {e}")
+                break
+    finally:
+        if connection.is_open:
+            # Frame-urile incomplete rămase la oprire pleacă așa cum sunt
+            for (exchange, routing_key), pending in frames.items():
+                if pending:
+                    channel.basic_publish(exchange=exchange, routing_key=routing_key,
+                                          body=sensor_codec.encode_binary(pending), properties=properties)
+                    stats.record(0.0, len(pending), len(pending) * sensor_codec.RECORD.size)
+            connection.close()
+
+
+def run(args, shards: int):
+    device_ids = list(range(args.device_start, args.device_start + args.devices))
+
+    # Fiecare device aparține unei singure conexiuni (ordinea citirilor per device se păstrează)
+    assignments = [device_ids[i::args.connections] for i in range(args.connections)]
+    stats = [PublisherStats() for _ in range(args.connections)]
+    stop = threading.Event()
+
+    rate_text = f"{args.rate} readings/s" if args.rate > 0 else "unlimited"
+    print(f" [LOAD] mode={args.mode} devices={args.devices} connections={args.connections} "
+          f"rate={rate_text} shards={shards} confirm={args.confirm} format={args.format}")
+
+    threads = [
+        threading.Thread(target=run_connection, args=(i, assignments[i], args, shards, stop, stats[i]), daemon=True)
+        for i in range(args.connections)
+    ]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+
+    last_sent = 0
+    last_report = started
+    try:
+        while any(t.is_alive() for t in threads):
+            time.sleep(1)
+            now = time.perf_counter()
+            if args.duration and now - started >= args.duration:
+                break
+            if now - last_report >= 5:
+                sent = sum(s.sent for s in stats)
+                print(f" [LOAD] {sent} readings sent, {(sent - last_sent) / (now - last_report):.0f} readings/s")
+                last_sent, last_report = sent, now
+    except KeyboardInterrupt:
+        print("\n [LOAD] Interrupted.")
+
+    stop.set()
+    for t in threads:
+        t.join(timeout=5)
+    elapsed = time.perf_counter() - started
+
+    sent = sum(s.sent for s in stats)
+    errors = sum(s.errors for s in stats)
+    latencies = sorted(l for s in stats for l in s.latencies)
+    print(" [LOAD] ---------------- results ----------------")
+    messages = sum(s.messages for s in stats)
+    size = sum(s.bytes for s in stats)
+    print(f" [LOAD] sent={sent} readings in {messages} messages, errors={errors}, elapsed={elapsed:.1f}s")
+    print(f" [LOAD] throughput={sent / elapsed:.0f} readings/s, {size / max(sent, 1):.1f} bytes/reading")
+    print(" [LOAD] publish latency ms: " + " ".join(
+        f"p{p}={percentile(latencies, p) * 1000:.3f}" for p in (50, 90, 99, 99.9)
+    ))
@@ -3,11 +3,18 @@ import json
 import time
 import random
 import sys
+import os
+import argparse
 import threading  # <--- Import necesar pentru paralelism
 from datetime import datetime, timedelta
 
+# Modulul comun 'shared' (topologia cozilor) e în directorul părinte
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.sensor_topology import LEGACY_SENSOR_QUEUE, SENSOR_EXCHANGE, declare_sensor_topology, shard_for
+
 # 1. Citim Configurația (Listă de ID-uri)
 DEVICE_IDS = [1]  # Default
+SENSOR_SHARDS = 0  # 0 = coada veche 'sensor_data'; N = partiționare pe N shard-uri după device_id
 try:
     with open('config.json', 'r') as f:
         config = json.load(f)
@@ -16,12 +23,13 @@ try:
             DEVICE_IDS = config["device_ids"]
         elif "device_id" in config:
             DEVICE_IDS = [config["device_id"]]
+        SENSOR_SHARDS = int(config.get("sensor_shards", 0))
 except:
     print(" [!] Config file not found or invalid. Using default ID: 1")
 
 # Configurare RabbitMQ
 RABBIT_HOST = 'localhost'
-QUEUE_NAME = 'sensor_data'
+QUEUE_NAME = LEGACY_SENSOR_QUEUE
 
 
 def generate_sensor_value():
@@ -43,7 +51,13 @@ def simulate_single_device(device_id):
         # Fiecare thread își face propria conexiune (Thread-Safe)
         connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBIT_HOST))
         channel = connection.channel()
-        channel.queue_declare(queue=QUEUE_NAME, durable=True)
+        if SENSOR_SHARDS > 0:
+            # Toate citirile unui device merg pe coada shard-ului său (afinitate pe worker)
+            declare_sensor_topology(channel, SENSOR_SHARDS)
+            exchange, routing_key = SENSOR_EXCHANGE, str(shard_for(device_id, SENSOR_SHARDS))
+        else:
+            channel.queue_declare(queue=QUEUE_NAME, durable=True)
+            exchange, routing_key = '', QUEUE_NAME
 
         # Adăugăm un mic delay random la start ca să nu trimită toți fix în aceeași milisecundă
         time.sleep(random.uniform(0, 2))
@@ -64,7 +78,7 @@ def simulate_single_device(device_id):
 
             message = json.dumps(payload)
 
-            channel.basic_publish(exchange='', routing_key=QUEUE_NAME, body=message)
+            channel.basic_publish(exchange=exchange, routing_key=routing_key, body=message)
 
             print(f" -> [Dev {device_id}] sent val: {value}")
 
@@ -79,7 +93,35 @@ def simulate_single_device(device_id):
             connection.close()
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Energy sensor simulator")
+    parser.add_argument("mode", nargs="?", default="classic", choices=["classic", "load", "replay"],
+                        help="classic: un thread per device din config.json; "
+                             "load: rată țintă pentru o flotă mare; replay: istoric back-dated, cât de repede se poate")
+    parser.add_argument("--host", default=RABBIT_HOST)
+    parser.add_argument("--devices", type=int, default=1000, help="număr de device-uri simulate")
+    parser.add_argument("--device-start", type=int, default=1, help="primul device_id")
+    parser.add_argument("--rate", type=float, default=1000, help="mesaje/secundă în total (0 = fără limită)")
+    parser.add_argument("--connections", type=int, default=4, help="câte conexiuni RabbitMQ (pool)")
+    parser.add_argument("--duration", type=float, default=60, help="secunde (0 = până la CTRL+C)")
+    parser.add_argument("--hours", type=float, default=24, help="replay: câte ore de istoric")
+    parser.add_argument("--format", default="json", choices=["json", "binary"], help="formatul mesajelor")
+    parser.add_argument("--frame", type=int, default=1, help="binary: câte citiri într-un mesaj")
+    parser.add_argument("--confirm", action="store_true", help="publisher confirms (latența include ack-ul broker-ului)")
+    args = parser.parse_args()
+    if args.mode == "replay":
+        args.rate = 0
+        args.duration = 0
+    return args
+
+
 def main():
+    args = parse_args()
+    if args.mode != "classic":
+        import load
+        load.run(args, SENSOR_SHARDS)
+        return
+
     print(f" [!!!] Pornire simulator MULTI-DEVICE pentru ID-urile: {DEVICE_IDS}")
     print(" [!!!] Apasa CTRL+C (in repetate randuri) pentru a opri tot.")
 
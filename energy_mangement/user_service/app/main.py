@@ -1,9 +1,14 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response, status
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from passlib.context import CryptContext
-#from typing import List
+from typing import Optional
 from fastapi.middleware.cors import CORSMiddleware
+import os
+import secrets
 from . import models, schemas, database, security
+from shared.listing import LISTING_HEADERS, listing_response, parse_fields
 
 # Creează tabelele în baza de date (pentru simplitate, la pornire)
 
@@ -16,8 +21,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=LISTING_HEADERS,
 )
 
+# Token partajat cu auth_service pentru /bulk; nesetat = endpoint-ul refuză orice cerere
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
+
+# Paginare pentru listarea utilizatorilor
+USER_PAGE_DEFAULT = int(os.getenv("USER_PAGE_DEFAULT", "100"))
+USER_PAGE_MAX = int(os.getenv("USER_PAGE_MAX", "1000"))
+USER_FIELDS = list(schemas.User.model_fields)  # fără hashed_password
+
 # Context pentru hash-uirea parolelor
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -51,32 +65,98 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)
     return db_user
 
 
+@app.post("/bulk", response_model=schemas.BulkUserResult)
+def create_users_bulk(
+        payload: schemas.BulkUserCreate,
+        db: Session = Depends(database.get_db),
+        x_internal_token: str | None = Header(default=None)
+):
+    """
+    Endpoint intern, apelat de outbox-ul din auth_service cu utilizatorii înregistrați între timp.
+    Idempotent: un auth_id deja sincronizat (ex. reîncercare după timeout) raportează "exists".
+    """
+    if not INTERNAL_API_TOKEN:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Internal API token not configured")
+    if not secrets.compare_digest(x_internal_token or "", INTERNAL_API_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid internal token")
+
+    auth_ids = [item.auth_id for item in payload.users]
+    usernames = [item.username for item in payload.users]
+    # O singură interogare pentru tot lotul
+    existing = db.execute(
+        select(models.User.auth_id, models.User.username)
+        .where(or_(models.User.auth_id.in_(auth_ids), models.User.username.in_(usernames)))
+    ).all()
+    known_auth_ids = {row.auth_id for row in existing}
+    taken_usernames = {row.username for row in existing}
+
+    results = []
+    for item in payload.users:
+        if item.auth_id in known_auth_ids:
+            results.append({"auth_id": item.auth_id, "status": "exists"})
+        elif item.username in taken_usernames:
+            results.append({"auth_id": item.auth_id, "status": "conflict"})
+        else:
+            db.add(models.User(
+                username=item.username, hashed_password=item.hashed_password, role=item.role, auth_id=item.auth_id
+            ))
+            known_auth_ids.add(item.auth_id)
+            taken_usernames.add(item.username)
+            results.append({"auth_id": item.auth_id, "status": "created"})
+
+    db.commit()
+    return {"results": results}
+
+
 # --- Endpoint-uri protejate pentru ADMIN ---
 
 @app.get("/", response_model=list[schemas.User])
-def read_users(
-        skip: int = 0,
-        limit: int = 100,
-        db: Session = Depends(database.get_db),
+async def read_users(
+        request: Request,
+        cursor: Optional[int] = Query(None, description="Valoarea X-Next-Cursor din pagina anterioară"),
+        limit: int = Query(USER_PAGE_DEFAULT, ge=1, le=USER_PAGE_MAX),
+        skip: int = Query(0, ge=0, description="Depreciat: folosiți cursor"),
+        role: Optional[str] = None,
+        username_prefix: Optional[str] = None,
+        fields: Optional[str] = Query(None, description="Coloanele dorite, ex: id,username"),
+        db: AsyncSession = Depends(database.get_async_db),
         admin_user: dict = Depends(security.require_admin_role)
-):
+) -> Response:
     """
     Obține o listă cu toți utilizatorii. [cite_start]Doar pentru Admin. [cite: 26, 37]
+    Paginat după id (keyset), cu X-Next-Cursor și ETag / If-None-Match ca la /devices.
     """
-    users = db.query(models.User).offset(skip).limit(limit).all()
-    return users
+    columns = parse_fields(fields, USER_FIELDS)
+    query = select(*[getattr(models.User, name) for name in columns])
+    if role:
+        query = query.where(models.User.role == role)
+    if username_prefix:
+        query = query.where(models.User.username.startswith(username_prefix, autoescape=True))
+    if cursor is not None:
+        query = query.where(models.User.id > cursor)
+    elif skip:
+        query = query.offset(skip)
+
+    result = await db.execute(query.order_by(models.User.id).limit(limit + 1))
+    return listing_response(request, [dict(row) for row in result.mappings()], limit)
+
+
+@app.get("/metrics")
+def get_metrics(admin_user: dict = Depends(security.require_admin_role)):
+    # Declarat înaintea rutei /{user_id}, altfel "metrics" ar fi tratat ca id
+    return {"jwt_cache": security.token_cache.stats()}
 
 
 @app.get("/{user_id}", response_model=schemas.User)
-def read_user(
+async def read_user(
         user_id: int,
-        db: Session = Depends(database.get_db),
+        db: AsyncSession = Depends(database.get_async_db),
         admin_user: dict = Depends(security.require_admin_role)
 ):
     """
     Obține detalii despre un utilizator specific, după ID. Doar pentru Admin.
     """
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    db_user = await db.get(models.User, user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
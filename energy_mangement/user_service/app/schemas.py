@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 # Schema de bază pentru utilizator (câmpuri comune)
 class UserBase(BaseModel):
@@ -24,4 +24,23 @@ class User(UserBase):
     role: str
 
     class Config:
-        from_attributes = True # <-- MODIFICARE: În loc de orm_mode = True
\ No newline at end of file
+        from_attributes = True # <-- MODIFICARE: În loc de orm_mode = True
+
+# --- Sincronizare în lot din auth_service (outbox) ---
+
+# Parola vine deja hash-uită de auth_service, nu o mai hash-uim a doua oară
+class BulkUserItem(UserBase):
+    hashed_password: str
+    role: str = "Client"
+    auth_id: int
+
+class BulkUserCreate(BaseModel):
+    users: List[BulkUserItem]
+
+# status: "created" | "exists" (același auth_id, deja sincronizat) | "conflict" (username ocupat de alt utilizator)
+class BulkUserStatus(BaseModel):
+    auth_id: int
+    status: str
+
+class BulkUserResult(BaseModel):
+    results: List[BulkUserStatus]
@@ -1,13 +1,18 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
-from jose import JWTError, jwt
+from jose import JWTError
 import os
 
+from shared.jwt_cache import JWTCache
+
 # Acestea TREBUIE să fie identice cu cele din auth_service
 SECRET_KEY = os.getenv("SECRET_KEY", "un-secret-foarte-sigur-default")
 ALGORITHM = "HS256"
 
+# Token-urile deja verificate (semnătură + claims) sunt ținute în cache până la expirare
+token_cache = JWTCache(SECRET_KEY, [ALGORITHM])
+
 # Aici se specifică URL-ul de unde se obține token-ul (la API Gateway)
 # Chiar dacă e în alt serviciu, FastAPI trebuie să știe calea
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
@@ -25,7 +30,7 @@ async def get_current_user_data(token: str = Depends(oauth2_scheme)):
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = token_cache.decode(token)
         username: str = payload.get("sub")
         role: str = payload.get("role")
 